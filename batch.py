@@ -0,0 +1,193 @@
+import argparse
+import contextlib
+import multiprocessing
+import os
+import time
+import traceback
+
+import cv2
+
+import figures
+import memory
+import pipeline
+import pedestal
+import tiles
+from cache import ResultCache
+from offset import length
+from profiling import Profiler
+from pedestal import PedestalLibrary
+
+# GUIなしで 輪郭線作成 → 台座合成 → SVG出力 をフォルダ単位で実行する
+# 例: python app.py batch in_dir out_dir --base 14mm --workers 8
+#     python app.py batch in_dir out_dir --all-bases   （台座サイズごとに 名前_14mm.svg などを出力）
+#     python app.py batch in_dir out_dir --workers 2 --max-rss-mb 3500   （ワーカーごとのメモリ上限）
+#     python app.py batch in_dir out_dir --figures   （1枚に複数キャラクターのシートを 名前_01.svg … に分けて出力）
+#     python app.py batch in_dir out_dir --format dxf   （カット線だけの DXF、pdf ならカット線と印刷画像のレイヤー付きPDF）
+
+
+# ワーカープロセスごとに1回だけ台座画像を読み込む
+_pedestals = None
+_cache = None
+_trace_dir = None
+
+
+def _init_worker(assets_dir, cache_dir=None, cache_bytes=None, trace_dir=None, threads=1, max_rss=None):
+    global _pedestals, _cache, _trace_dir
+    # プロセス数 × OpenCVスレッド数 でコアを取り合わないようにする
+    # threads: プロセス内のタイル分割・台座ごとの並列数（プロセス数がコア数より少ないときに余りを回す）
+    # max_rss: ワーカー1つあたりのメモリ上限 [bytes]（超えそうな処理はタイルを細かくし、収まらない画像は失敗にする）
+    cv2.setNumThreads(1)
+    tiles.set_workers(threads)
+    memory.set_limit(max_rss)
+    _pedestals = PedestalLibrary(assets_dir)
+    # キャッシュは全ワーカーで同じディレクトリを共有する（書き込みは一時ファイル経由で置き換え）
+    if cache_bytes:
+        _cache = ResultCache(cache_dir, max_bytes=cache_bytes)
+    _trace_dir = trace_dir
+
+
+def _process_one(job):
+    # outputs: {台座: 出力パス}（--all-bases のときは全台座ぶん）
+    # sheet: 複数キャラクターのシートとして処理する場合の (最小面積, 1ファイルにまとめるか)、通常は None
+    # print_layer: PDF に印刷画像のレイヤーを入れるか
+    in_path, outputs, gap, thickness, tolerance, print_layer, sheet = job
+    start = time.perf_counter()
+    # --trace-dir 指定時は1ファイルごとにステージの計測結果を書き出す
+    prof = Profiler(os.path.basename(in_path)) if _trace_dir else None
+    try:
+        with prof or contextlib.nullcontext():
+            if sheet is None:
+                pipeline.process_variants(in_path, outputs, _pedestals, cache=_cache, gap=gap, thickness=thickness,
+                                          tolerance=tolerance, print_layer=print_layer)
+                written = list(outputs.values())
+            else:
+                min_area, single_file = sheet
+                written = figures.process_sheet(in_path, outputs, _pedestals, cache=_cache, gap=gap,
+                                                thickness=thickness, min_area=min_area, single_file=single_file,
+                                                tolerance=tolerance, print_layer=print_layer)
+        return in_path, written, True, time.perf_counter() - start, ""
+    except Exception as e:
+        detail = f"{type(e).__name__}: {e}\n{traceback.format_exc()}"
+        return in_path, list(outputs.values()), False, time.perf_counter() - start, detail
+    finally:
+        if prof is not None:
+            # 計測結果を書けなくても、この画像の結果と残りの画像の処理は続ける
+            stem = os.path.splitext(os.path.basename(in_path))[0]
+            try:
+                prof.write_trace(os.path.join(_trace_dir, stem + ".trace.json"))
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Warning: failed to write trace for {os.path.basename(in_path)}: {e}")
+
+
+def collect_inputs(in_dir):
+    return sorted(
+        os.path.join(in_dir, name)
+        for name in os.listdir(in_dir)
+        if name.lower().endswith(pipeline.IMAGE_EXTENSIONS)
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="app.py batch",
+        description="フォルダ内の画像を一括で輪郭線作成・台座合成・SVG出力する"
+    )
+    parser.add_argument("in_dir", help="入力画像フォルダ")
+    parser.add_argument("out_dir", help="SVG出力先フォルダ")
+    parser.add_argument("--base", default="16mm", choices=pedestal.sort_keys(set(pedestal.BASE_SIZES) | set(pedestal.discover(pipeline.get_assets_dir()))),
+                        help="台座サイズ")
+    parser.add_argument("--all-bases", action="store_true",
+                        help="全ての台座サイズで出力する（輪郭線は1回だけ作り、ファイル名に台座サイズを付ける）")
+    parser.add_argument("--figures", action="store_true",
+                        help="1枚に複数のキャラクターが描かれたシートとして、キャラクターごとに 名前_01.svg … を出力する")
+    parser.add_argument("--one-file", action="store_true",
+                        help="--figures のとき、全キャラクターを並べた1つのSVGにまとめる")
+    parser.add_argument("--min-area", type=int, default=None,
+                        help="--figures のとき、キャラクターとみなす塊の最小面積[px]（既定: 最大の塊の2%%）")
+    parser.add_argument("--format", choices=[ext[1:] for ext in pipeline.EXPORT_FORMATS], default="svg",
+                        help="出力形式（dxf はカット線だけ、pdf はカット線と印刷画像をレイヤーに分ける）")
+    parser.add_argument("--no-print-layer", action="store_true",
+                        help="--format pdf のとき、印刷画像を入れずにカット線だけにする")
+    parser.add_argument("--gap", type=length, default=pipeline.OUTLINE_GAP,
+                        help="キャラクターから輪郭リングまでの隙間（例: 1px, 0.5mm）")
+    parser.add_argument("--thickness", type=length, default=pipeline.OUTLINE_THICKNESS,
+                        help="輪郭リングの太さ（例: 1.5px, 2mm）")
+    parser.add_argument("--cut-tolerance", type=length, default=pipeline.CUT_TOLERANCE,
+                        help="カット線のパスが輪郭から離れてよい距離（例: 0.1mm, 1px）。大きいほどノードが減る")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数")
+    parser.add_argument("--cache-dir", default=None, help="結果キャッシュの保存先（既定: ~/.cutline/cache）")
+    parser.add_argument("--cache-size-mb", type=int, default=512, help="結果キャッシュの上限サイズ[MB]")
+    parser.add_argument("--no-cache", action="store_true", help="結果キャッシュを使わない")
+    parser.add_argument("--max-rss-mb", type=int, default=0,
+                        help="ワーカー1つあたりのメモリ上限[MB]（0なら制限しない）")
+    parser.add_argument("--trace-dir", default=None,
+                        help="ステージごとの計測結果（Chromeトレース形式のJSON）を画像ごとに書き出すフォルダ")
+    return parser
+
+
+def run(in_dir, out_dir, base="16mm", workers=None, cache_dir=None, cache_size_mb=512, trace_dir=None,
+        gap=pipeline.OUTLINE_GAP, thickness=pipeline.OUTLINE_THICKNESS, all_bases=False, max_rss_mb=0,
+        sheet=False, min_area=None, one_file=False, tolerance=pipeline.CUT_TOLERANCE, fmt="svg", print_layer=True):
+    # 戻り値: 失敗したファイル数
+    # cache_size_mb=0 ならキャッシュを使わない、max_rss_mb=0 ならメモリ上限なし
+    # sheet=True なら画像を複数キャラクターのシートとして処理する（min_area / one_file は figures.export_figures と同じ）
+    # all_bases=True なら assets の全台座について 名前_台座.svg を出力する
+    # fmt: 出力形式 "svg" / "dxf" / "pdf"（print_layer は PDF に印刷画像を入れるか）
+    assets_dir = pipeline.get_assets_dir()
+    os.makedirs(out_dir, exist_ok=True)
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+
+    inputs = collect_inputs(in_dir)
+    if not inputs:
+        print(f"No images found in {in_dir}")
+        return 0
+
+    bases = PedestalLibrary(assets_dir).keys() if all_bases else [base]
+    jobs = []
+    for in_path in inputs:
+        stem = os.path.splitext(os.path.basename(in_path))[0]
+        if all_bases:
+            outputs = pipeline.variant_paths(out_dir, stem, bases, "." + fmt)
+        else:
+            outputs = {base: os.path.join(out_dir, f"{stem}.{fmt}")}
+        jobs.append((in_path, outputs, gap, thickness, tolerance, print_layer, (min_area, one_file) if sheet else None))
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(jobs)))
+    print(f"Processing {len(jobs)} images with {workers} workers (base {', '.join(bases)})")
+
+    failed = 0
+    start = time.perf_counter()
+    cache_bytes = cache_size_mb * 1024 * 1024
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with multiprocessing.Pool(workers, initializer=_init_worker,
+                              initargs=(assets_dir, cache_dir, cache_bytes, trace_dir, threads,
+                                        max_rss_mb * 2**20)) as pool:
+        # 終わった順に結果を受け取って1ファイルずつ報告する
+        for in_path, out_paths, ok, elapsed, detail in pool.imap_unordered(_process_one, jobs):
+            name = os.path.basename(in_path)
+            if ok:
+                print(f"[OK] {name} -> {', '.join(out_paths)} ({elapsed:.2f}s)")
+            else:
+                failed += 1
+                print(f"[NG] {name} ({elapsed:.2f}s): {detail}")
+
+    total = time.perf_counter() - start
+    print(f"Done: {len(jobs) - failed} succeeded, {failed} failed, {total:.2f}s total "
+          f"({len(jobs) / total:.2f} images/s)")
+    return failed
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.one_file and args.format != "svg":
+        parser.error("--one-file は --format svg のときだけ使えます")
+    if args.max_rss_mb and not memory.supported():
+        parser.error("この環境ではメモリ使用量（RSS）を測れないので、--max-rss-mb は使えません")
+    failed = run(args.in_dir, args.out_dir, base=args.base, workers=args.workers,
+                 cache_dir=args.cache_dir, cache_size_mb=0 if args.no_cache else args.cache_size_mb,
+                 trace_dir=args.trace_dir, gap=args.gap, thickness=args.thickness, all_bases=args.all_bases,
+                 max_rss_mb=args.max_rss_mb, sheet=args.figures, min_area=args.min_area, one_file=args.one_file,
+                 tolerance=args.cut_tolerance, fmt=args.format, print_layer=not args.no_print_layer)
+    return 1 if failed else 0
@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline  # noqa: E402
+
+# combine_base のピクセル単位ループ（旧実装）と配列演算版の速度比較
+# 例: python benchmarks/bench_combine_loops.py --sizes 500x750 1000x1500 2000x3000 4000x6000
+
+
+def band_extents_loop(binm_crop, y_start, y_stop):
+    # 旧実装: 30%ラインから足元までを1画素ずつ走査
+    cw = binm_crop.shape[1]
+    x_left_30 = cw
+    x_right_30 = 0
+    for y_pos in range(y_start, y_stop):
+        for x_pos in range(cw):
+            if binm_crop[y_pos, x_pos] == 255:
+                x_left_30 = min(x_left_30, x_pos)
+                x_right_30 = max(x_right_30, x_pos)
+    return x_left_30, x_right_30
+
+
+def make_inputs(w, h):
+    # 足元が画像下端にある楕円キャラクターの二値マスク
+    binm = np.zeros((h, w), np.uint8)
+    cv2.ellipse(binm, (w // 2, int(h * 0.6)), (int(w * 0.3), int(h * 0.4) - 1), 0, 0, 360, 255, -1)
+    y_start = int((h - 1) * 0.7)
+    return binm, y_start
+
+
+def timed(fn, *args, repeat=1):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def run(sizes, repeat, skip_loop_above):
+    print(f"{'size':>11} {'kernel':>12} {'loop[s]':>10} {'array[s]':>10} {'speedup':>9}")
+    for w, h in sizes:
+        binm, y_start = make_inputs(w, h)
+        run_loop = w * h <= skip_loop_above
+
+        # step 8: 下部30%帯の左右端
+        t_new, res_new = timed(pipeline.find_band_extents, binm, y_start, h, repeat=repeat)
+        if run_loop:
+            t_old, res_old = timed(band_extents_loop, binm, y_start, h)
+            assert res_old == res_new, (res_old, res_new)
+            print(f"{w:>5}x{h:<5} {'band':>12} {t_old:>10.4f} {t_new:>10.6f} {t_old / t_new:>8.0f}x")
+        else:
+            print(f"{w:>5}x{h:<5} {'band':>12} {'-':>10} {t_new:>10.6f} {'-':>9}")
+
+
+def parse_size(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="combine_base のループ処理ベンチマーク")
+    parser.add_argument("--sizes", nargs="+", type=parse_size,
+                        default=[(500, 750), (1000, 1500), (2000, 3000), (4000, 6000)])
+    parser.add_argument("--repeat", type=int, default=5, help="配列演算版の計測回数（最短時間を採用）")
+    parser.add_argument("--skip-loop-above", type=int, default=25_000_000,
+                        help="この画素数を超えるサイズでは旧実装の計測を省略する")
+    args = parser.parse_args(argv)
+    run(args.sizes, args.repeat, args.skip_loop_above)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import argparse
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline  # noqa: E402
+from bench_pipeline import RESOLUTIONS, SHAPES, make_silhouette  # noqa: E402
+from document import CutDocument  # noqa: E402
+from geometry import bezier_points, fit_path  # noqa: E402
+from offset import to_px  # noqa: E402
+from pedestal import PedestalLibrary  # noqa: E402
+
+# カット線のパス: 旧実装（500点に間引き → スムージング → 全点をベジェでつなぐ）と許容誤差つきの当てはめの比較
+# ノード数・パス文字列の長さ・輪郭からのずれの最大値・時間を表示する
+# 例: python benchmarks/bench_cut_path.py --resolutions 1k 4k --tolerances 0.05mm 0.1mm 0.2mm
+
+
+# 旧実装のカット線のパス（pipeline では fit_path に置き換えたので、比較用にここに残す）
+def subsample_contour(contour, max_points=500):
+    # cv2.findContours の輪郭を (N, 2) に整形し、おおよそ max_points 点に間引く
+    # max_points=None なら間引かない
+    pts = np.asarray(contour).reshape(-1, 2)
+    if max_points:
+        step = max(1, len(pts) // max_points)
+        pts = pts[::step]
+    return pts
+
+
+def smooth_closed(points, window_size=5):
+    # 閉じた点列の移動平均（前後の点は循環して参照する）
+    # 窓は従来の実装と同じく range(-window_size//2, window_size//2 + 1)
+    pts = np.asarray(points)
+    n = len(pts)
+    if n == 0:
+        return pts.astype(np.float64)
+    offsets = np.arange(-window_size // 2, window_size // 2 + 1)
+    idx = (np.arange(n)[:, None] + offsets) % n
+    # 整数座標の合計は誤差なく求まるので、最後に一度だけ割る
+    return pts[idx].sum(axis=1) / len(offsets)
+
+
+def close_polyline(points):
+    # 始点と終点が異なる場合は始点を末尾に追加して閉じる
+    if len(points) and not np.array_equal(points[0], points[-1]):
+        points = np.vstack([points, points[:1]])
+    return points
+
+
+def bezier_path(points, tension=0.2, base_ratio=0.95):
+    # 閉じた点列から、隣接点で制御点を決める3次ベジェのパス文字列を作る
+    # 下端から (1 - base_ratio) の範囲にある点（台座部分）は直線で結ぶ
+    pts = np.asarray(points, dtype=np.float64)
+    n = len(pts)
+    if n < 4:
+        return "M" + " L".join(f"{x},{y}" for x, y in pts.tolist()) + "Z"
+
+    ys = pts[:, 1]
+    min_y, max_y = ys.min(), ys.max()
+    base_threshold = min_y + (max_y - min_y) * base_ratio
+
+    # i = 1 .. n-3 の区間（p1 → p2）
+    p0, p1, p2, p3 = pts[:-3], pts[1:-2], pts[2:-1], pts[3:]
+    mid = (p1 + p2) / 2
+    cp1 = (p1 + (p2 - p0) * tension) * 0.8 + mid * 0.2
+    cp2 = (p2 - (p3 - p1) * tension) * 0.8 + mid * 0.2
+    is_base = ys[1:-2] > base_threshold
+
+    # 最後の区間（終点側は p3 が無いので p2 - p1 で代用）
+    q0, q1, q2 = pts[-3], pts[-2], pts[-1]
+    q_mid = (q1 + q2) / 2
+    q_cp1 = (q1 + (q2 - q0) * tension) * 0.8 + q_mid * 0.2
+    q_cp2 = (q2 - (q2 - q1) * tension) * 0.8 + q_mid * 0.2
+
+    parts = ["M{},{}".format(*pts[0].tolist())]
+    parts.extend(
+        f" L{ex},{ey}" if base else f" C{ax},{ay} {bx},{by} {ex},{ey}"
+        for (ax, ay), (bx, by), (ex, ey), base
+        in zip(cp1.tolist(), cp2.tolist(), p2.tolist(), is_base.tolist())
+    )
+    parts.append(" C{},{} {},{} {},{}".format(*q_cp1.tolist(), *q_cp2.tolist(), *q2.tolist()))
+    parts.append("Z")
+    return "".join(parts)
+
+
+def contour_to_path(contour, max_points=500, window_size=5, tension=0.2):
+    # 輪郭 → 間引き → スムージング → 閉じる → パス文字列
+    pts = subsample_contour(contour, max_points)
+    pts = close_polyline(smooth_closed(pts, window_size))
+    return bezier_path(pts, tension)
+
+
+def timed(fn, *args, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def path_polyline(path_data, step=0.25):
+    # 絶対座標の M / L / C / Z のパスを、間隔 step [px] 程度の折れ線にする
+    out, cur, start = [], None, None
+    for cmd, args in re.findall(r"([MLCZ])([^MLCZ]*)", path_data):
+        pts = np.array([float(v) for v in re.findall(r"-?[\d.]+", args)]).reshape(-1, 2)
+        if cmd == "M":
+            cur = start = pts[0]
+            out.append(cur[None])
+        elif cmd == "L" or cmd == "Z":
+            for end in (pts if cmd == "L" else [start]):
+                n = int(np.hypot(*(end - cur)) / step) + 2
+                out.append(np.linspace(cur, end, n))
+                cur = end
+        else:
+            ctrl = np.vstack([cur, pts])
+            n = int(np.hypot(*np.diff(ctrl, axis=0).T).sum() / step) + 2
+            out.append(bezier_points(ctrl, np.linspace(0.0, 1.0, n)))
+            cur = pts[-1]
+    return np.vstack(out)
+
+
+def max_deviation(contour, path_data):
+    # 輪郭の各点からパスまでの距離の最大値 [px]（折れ線の頂点までの距離なので、最大で step/2 だけ大きめに出る）
+    line = path_polyline(path_data)
+    worst = 0.0
+    for chunk in np.array_split(contour, max(1, len(contour) // 256)):
+        d = np.hypot(chunk[:, None, 0] - line[None, :, 0], chunk[:, None, 1] - line[None, :, 1])
+        worst = max(worst, float(d.min(axis=1).max()))
+    return worst
+
+
+def run(resolutions, shapes, base, tolerances, repeat):
+    lib = PedestalLibrary(pipeline.get_assets_dir())
+    print(f"{'case':<12} {'method':<14} {'points':>7} {'nodes':>6} {'chars':>7} {'max dev':>8} {'ms':>8}")
+    for res in resolutions:
+        for shape in shapes:
+            doc = CutDocument(make_silhouette(shape, RESOLUTIONS[res]))
+            doc = pipeline.combine_base(pipeline.create_outline(doc), lib.get(base), lib.size(base))
+            contour = doc.cut_contour.reshape(-1, 2).astype(np.float64)
+            case = f"{shape}/{res}"
+            legacy, t = timed(contour_to_path, doc.cut_contour, repeat=repeat)
+            nodes = legacy.count("C") + legacy.count("L")
+            print(f"{case:<12} {'legacy':<14} {len(contour):>7} {nodes:>6} {len(legacy):>7} "
+                  f"{max_deviation(contour, legacy):>8.2f} {t * 1000:>8.1f}")
+            for tol in tolerances:
+                (path, nodes), t = timed(fit_path, contour, to_px(tol), repeat=repeat)
+                print(f"{case:<12} {'fit ' + tol:<14} {len(contour):>7} {nodes:>6} {len(path):>7} "
+                      f"{max_deviation(contour, path):>8.2f} {t * 1000:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="カット線のパスの当てはめベンチマーク")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=["1k", "4k"])
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--base", default="16mm", help="台座サイズ")
+    parser.add_argument("--tolerances", nargs="+", default=["0.05mm", pipeline.CUT_TOLERANCE, "0.2mm"],
+                        help="許容誤差（例: 0.1mm, 1px）")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数（最短時間を採用）")
+    args = parser.parse_args(argv)
+    run(args.resolutions, args.shapes, args.base, args.tolerances, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
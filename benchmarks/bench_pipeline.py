@@ -0,0 +1,185 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pedestal  # noqa: E402
+import pipeline  # noqa: E402
+from document import CutDocument  # noqa: E402
+from pedestal import PedestalLibrary  # noqa: E402
+from profiling import Profiler  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 輪郭線作成 → 台座合成 → SVG出力 のステージ別ベンチマーク
+# 合成したキャラクターのシルエットを解像度・台座サイズごとに処理し、結果をJSONで保存する
+# 例: python benchmarks/bench_pipeline.py --resolutions 1k 4k --out results.json
+#     python benchmarks/bench_pipeline.py --compare old.json new.json
+
+# 長辺の画素数（縦長 2:3 の画像を作る）
+RESOLUTIONS = {"1k": 1024, "4k": 4096, "8k": 8192}
+SHAPES = ("blob", "limbs", "holes", "parts")
+STAGES = ("create_outline", "combine_base", "export_to_svg")
+
+
+def make_silhouette(shape, long_side):
+    # 白背景に塗りつぶしたキャラクター風の図形（足元が画像の下側にある）
+    h = long_side
+    w = long_side * 2 // 3
+    img = np.full((h, w, 3), 255, np.uint8)
+    cx = w // 2
+    body = (40, 90, 180)
+    cv2.circle(img, (cx, int(h * 0.25)), int(w * 0.15), (200, 120, 40), -1)
+    cv2.ellipse(img, (cx, int(h * 0.72)), (int(w * 0.22), int(h * 0.2)), 0, 0, 360, body, -1)
+    if shape == "limbs":
+        # 細い腕と脚
+        t = max(3, w // 80)
+        cv2.line(img, (cx, int(h * 0.6)), (cx - int(w * 0.4), int(h * 0.45)), body, t)
+        cv2.line(img, (cx, int(h * 0.6)), (cx + int(w * 0.38), int(h * 0.5)), body, t)
+        cv2.line(img, (cx - int(w * 0.1), int(h * 0.85)), (cx - int(w * 0.16), int(h * 0.97)), body, t)
+        cv2.line(img, (cx + int(w * 0.1), int(h * 0.85)), (cx + int(w * 0.16), int(h * 0.97)), body, t)
+    elif shape == "holes":
+        # 胴体と頭に穴（背景色）を開ける
+        for fy, fr in ((0.65, 0.05), (0.78, 0.04), (0.25, 0.04)):
+            cv2.circle(img, (cx + int(w * 0.05), int(h * fy)), int(w * fr), (255, 255, 255), -1)
+    elif shape == "parts":
+        # 本体から離れた小物（丸と四角）
+        cv2.circle(img, (int(w * 0.85), int(h * 0.12)), int(w * 0.06), (30, 160, 60), -1)
+        cv2.rectangle(img, (int(w * 0.05), int(h * 0.05)), (int(w * 0.2), int(h * 0.12)), (160, 40, 160), -1)
+    return Image.fromarray(img)
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round((rss if sys.platform == "darwin" else rss * 1024) / 2**20, 1)
+
+
+def run_case(case):
+    # 1ケースを repeat 回実行し、ステージごとの最短時間を返す
+    # 最大RSSを分けて測るため、ケースごとに新しいプロセスで実行する（maxtasksperchild=1）
+    shape, res, base, repeat = case
+    lib = PedestalLibrary(pipeline.get_assets_dir())
+    ped, size = lib.get(base), lib.size(base)
+    image = make_silhouette(shape, RESOLUTIONS[res])
+    result = {"shape": shape, "resolution": res, "base": base,
+              "width": image.width, "height": image.height,
+              "megapixels": round(image.width * image.height / 1e6, 3)}
+
+    best = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, "out.svg")
+        try:
+            for _ in range(repeat):
+                # tracemalloc は時間計測を歪めるので、ここでは時間だけを記録する
+                with Profiler(f"{shape}-{res}-{base}", track_memory=False) as prof:
+                    doc = CutDocument(image)
+                    doc = pipeline.create_outline(doc)
+                    doc = pipeline.combine_base(doc, ped, size)
+                    pipeline.export_to_svg(doc, out_path)
+                times = {e["name"]: e["dur"] / 1e6 for e in prof.stages() if e["name"] in STAGES}
+                times["total"] = sum(times.values())
+                for name, t in times.items():
+                    best[name] = min(best.get(name, t), t)
+            result["cut_points"] = int(len(doc.cut_contour)) if doc.cut_contour is not None else 0
+            result["ok"] = True
+        except Exception as e:
+            # 図形によっては処理が失敗することがあるので記録して続ける
+            result["ok"] = False
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    result["seconds"] = {name: round(t, 6) for name, t in best.items()}
+    if best.get("total"):
+        result["images_per_s"] = round(1 / best["total"], 3)
+        result["megapixels_per_s"] = round(result["megapixels"] / best["total"], 3)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def print_table(results):
+    print(f"{'shape':<6} {'res':>3} {'base':>5} {'MP':>6} {'outline':>8} {'combine':>8} {'export':>8} "
+          f"{'total[s]':>9} {'img/s':>7} {'MP/s':>7} {'RSS[MB]':>8}")
+    for r in results:
+        if not r["ok"]:
+            print(f"{r['shape']:<6} {r['resolution']:>3} {r['base']:>5} {r['megapixels']:>6} NG: {r['error']}")
+            continue
+        s = r["seconds"]
+        print(f"{r['shape']:<6} {r['resolution']:>3} {r['base']:>5} {r['megapixels']:>6} "
+              f"{s['create_outline']:>8.3f} {s['combine_base']:>8.3f} {s['export_to_svg']:>8.3f} "
+              f"{s['total']:>9.3f} {r['images_per_s']:>7.2f} {r['megapixels_per_s']:>7.2f} "
+              f"{r['peak_rss_mb'] if r['peak_rss_mb'] is not None else '-':>8}")
+
+
+def compare(old_path, new_path):
+    # 2つの結果ファイルの同じケースを比べる（speedup = 旧 / 新）
+    with open(old_path, encoding="utf-8") as f:
+        old = {(r["shape"], r["resolution"], r["base"]): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)["results"]
+    print(f"{'shape':<6} {'res':>3} {'base':>5} {'old[s]':>9} {'new[s]':>9} {'speedup':>8} {'RSS old':>8} {'RSS new':>8}")
+    for r in new:
+        o = old.get((r["shape"], r["resolution"], r["base"]))
+        if o is None or not (o["ok"] and r["ok"]):
+            continue
+        t_old, t_new = o["seconds"]["total"], r["seconds"]["total"]
+        print(f"{r['shape']:<6} {r['resolution']:>3} {r['base']:>5} {t_old:>9.3f} {t_new:>9.3f} "
+              f"{t_old / t_new:>7.2f}x {o['peak_rss_mb'] or '-':>8} {r['peak_rss_mb'] or '-':>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="パイプライン全体のステージ別ベンチマーク")
+    parser.add_argument("--resolutions", nargs="+", choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument("--shapes", nargs="+", choices=SHAPES, default=list(SHAPES))
+    parser.add_argument("--bases", nargs="+", default=list(pedestal.BASE_SIZES), help="台座サイズ")
+    parser.add_argument("--repeat", type=int, default=3, help="ケースごとの計測回数（最短時間を採用）")
+    parser.add_argument("--out", default=None, help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="2つの結果ファイルを比較する")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    cases = [(shape, res, base, args.repeat)
+             for res in args.resolutions for shape in args.shapes for base in args.bases]
+    results = []
+    with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+        for result in pool.imap(run_case, cases):
+            results.append(result)
+            status = f"{result['seconds']['total']:.3f}s" if result["ok"] else "NG"
+            print(f"[{len(results)}/{len(cases)}] {result['shape']} {result['resolution']} {result['base']}: {status}")
+    print_table(results)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=1)
+        print(f"Saved {len(results)} results to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
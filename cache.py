@@ -0,0 +1,145 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+# ステージ結果のディスクキャッシュ
+# キーは「入力画素のハッシュ＋パラメータ」から作る内容アドレス方式で、
+# 合計サイズが上限を超えたら最後に使ってから時間が経ったものから削除する（LRU）
+# 合計サイズは書き込むたびに足していき、上限を超えたとき（または RESCAN_PUTS 回ごと）だけフォルダ全体を数え直す
+# （同じフォルダに書く他のプロセスの分は数え直したときに反映される）
+
+# 何回書き込んだらフォルダ全体を数え直すか
+RESCAN_PUTS = 64
+# 上限を超えたときは上限のこの割合まで削除する（上限付近で書き込むたびに数え直さないように）
+EVICT_RATIO = 0.9
+
+
+def default_cache_dir():
+    return os.path.join(os.path.expanduser("~"), ".cutline", "cache")
+
+
+def array_digest(arr):
+    # 配列の形・型・画素からハッシュを作る
+    arr = np.ascontiguousarray(arr)
+    h = hashlib.sha256()
+    h.update(f"{arr.shape}{arr.dtype.str}".encode("ascii"))
+    h.update(memoryview(arr).cast("B"))
+    return h.hexdigest()
+
+
+def make_key(stage, *parts, **params):
+    # stage名・上流のキー・パラメータから64桁のキーを作る
+    payload = json.dumps([stage, parts, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=None, max_bytes=512 * 1024 * 1024):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total = None  # このプロセスから見たキャッシュの合計サイズ [bytes]（None なら未集計）
+        self._puts = 0  # 最後に数え直してから書き込んだ回数
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        # 1ディレクトリにファイルが集中しないよう先頭2桁で分ける
+        return os.path.join(self.directory, key[:2], key + ".npz")
+
+    def get(self, key):
+        # 戻り値: (配列のdict, メタデータのdict) または None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                arrays = {name: data[name] for name in data.files if name != "__meta__"}
+                meta = json.loads(str(data["__meta__"])) if "__meta__" in data.files else {}
+            # 最終利用時刻を更新（LRUの順番に使う）
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            # 未保存・他プロセスによる削除・壊れたファイルはキャッシュミス扱い
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return arrays, meta
+
+    def put(self, key, arrays=None, meta=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        buf = io.BytesIO()
+        np.savez_compressed(buf, __meta__=np.array(json.dumps(meta or {})), **(arrays or {}))
+        # 書き込み途中のファイルを他プロセスが読まないよう、一時ファイルから置き換える
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            old = os.stat(path).st_size
+        except OSError:
+            old = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(buf.getbuffer())
+            os.replace(tmp, path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            if self._total is not None:
+                self._total += buf.getbuffer().nbytes - old
+            self._puts += 1
+            rescan = self._total is None or self._total > self.max_bytes or self._puts >= RESCAN_PUTS
+        if rescan:
+            self.evict()
+
+    def entries(self):
+        # (最終利用時刻, サイズ, パス) の一覧
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".npz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # フォルダ全体を数え直し、合計サイズが上限を超えていたら上限の EVICT_RATIO 倍以下になるまで古いものから削除する
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes if total <= self.max_bytes else int(self.max_bytes * EVICT_RATIO)
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # 他のプロセスが先に削除した
+                except OSError:
+                    continue
+                total -= size
+            self._total = total
+            self._puts = 0
+
+    def clear(self):
+        with self._lock:
+            for _, _, path in self.entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total = None
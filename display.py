@@ -0,0 +1,86 @@
+import math
+from collections import OrderedDict
+
+from PIL import Image
+
+# プレビュー表示用の描画エンジン
+# 画像ごとに縮小ピラミッド（ミップマップ）を持ち、表示範囲だけを現在の倍率でリサンプルする
+
+FAST = Image.Resampling.BILINEAR
+HIGH = Image.Resampling.LANCZOS
+
+
+class MipmapPyramid:
+    def __init__(self, image, min_side=64):
+        # RGBAにそろえておくと各レベルの変換が不要になる
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        self.levels = [image]
+        self.min_side = min_side
+
+    @property
+    def size(self):
+        return self.levels[0].size
+
+    def level_for(self, zoom):
+        # 倍率 zoom 以上の解像度を持つ最も小さいレベルを選ぶ（必要になった分だけ作る）
+        k = 0
+        if zoom < 1.0:
+            k = int(math.floor(math.log2(1.0 / zoom)))
+        while len(self.levels) <= k:
+            prev = self.levels[-1]
+            if min(prev.size) // 2 < self.min_side:
+                break
+            self.levels.append(prev.reduce(2))
+        k = min(k, len(self.levels) - 1)
+        return self.levels[k]
+
+
+class ZoomRenderer:
+    def __init__(self, max_versions=3):
+        self.max_versions = max_versions
+        self._pyramids = OrderedDict()  # 画像バージョン -> (元画像, ピラミッド, 縮小率)
+        self._next_version = 0
+        self.version = None
+
+    def set_image(self, image, scale=1.0):
+        # 同じ画像が再び表示される場合はピラミッドを使い回す
+        # scale: image が本来の解像度の何倍に縮小されたものか（低解像度プレビューでは 1 未満）
+        #        倍率 zoom は本来の解像度に対する値のままにして、同じ大きさで表示する
+        for version, (img, _, s) in self._pyramids.items():
+            if img is image and s == scale:
+                self._pyramids.move_to_end(version)
+                self.version = version
+                return version
+        version = self._next_version
+        self._next_version += 1
+        self._pyramids[version] = (image, MipmapPyramid(image), scale)
+        while len(self._pyramids) > self.max_versions:
+            self._pyramids.popitem(last=False)
+        self.version = version
+        return version
+
+    def render(self, zoom, viewport=None, quality=HIGH):
+        # 中央寄せで表示したときに viewport (幅, 高さ) に収まる範囲だけを描画する
+        if self.version is None:
+            return None
+        _, pyramid, scale = self._pyramids[self.version]
+        zoom = zoom / scale
+        w, h = pyramid.size
+        zw, zh = max(1, int(w * zoom)), max(1, int(h * zoom))
+        vw, vh = viewport if viewport else (zw, zh)
+        out_w, out_h = min(zw, max(1, vw)), min(zh, max(1, vh))
+        vx0, vy0 = (zw - out_w) // 2, (zh - out_h) // 2
+
+        level = pyramid.level_for(zoom)
+        lw, lh = level.size
+        fx, fy = zw / lw, zh / lh
+        box = (vx0 / fx, vy0 / fy, (vx0 + out_w) / fx, (vy0 + out_h) / fy)
+
+        # RGBAのresizeは画像全体をアルファ乗算するため、先にフィルタ半径分の余白つきで切り出す
+        margin = int(math.ceil(3 * max(1.0, 1 / fx, 1 / fy))) + 1
+        cx0, cy0 = max(0, int(box[0]) - margin), max(0, int(box[1]) - margin)
+        cx1, cy1 = min(lw, int(math.ceil(box[2])) + margin), min(lh, int(math.ceil(box[3])) + margin)
+        region = level.crop((cx0, cy0, cx1, cy1))
+        box = (box[0] - cx0, box[1] - cy0, box[2] - cx0, box[3] - cy0)
+        return region.resize((out_w, out_h), quality, box=box)
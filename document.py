@@ -0,0 +1,125 @@
+import copy
+
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+
+from cache import array_digest
+
+# 処理中の状態を色付きピクセルではなくレイヤーとして保持するドキュメント
+# 各ステージは必要なレイヤーだけを読み書きし、表示用の画像は composite() で合成する
+
+RING_COLOR = (255, 0, 0, 255)      # 輪郭リング（従来の赤線）
+GUIDE_COLOR = (0, 0, 255, 255)     # 補助線（従来の青線）
+CUT_COLOR = (0, 255, 0, 255)       # カット線（従来の緑線）
+PEDESTAL_FILL = (128, 128, 128, 255)
+
+
+class CutDocument:
+    def __init__(self, image):
+        self.artwork = to_rgba_array(image)  # 印刷する絵柄 (H, W, 4)。元の PIL 画像は持たない
+        h, w = self.artwork.shape[:2]
+        self.canvas_size = (w, h)  # 台座を置くと下方向に広がる
+
+        # キャラクター側のレイヤー（絵柄と同じサイズ）
+        self.mask = None  # 二値マスク uint8
+        self.ring = None  # 輪郭リング uint8
+        self.subject_box = None  # キャラクター＋輪郭リングを含む範囲 (x, y, w, h)
+
+        # 台座合成で作るレイヤー（キャンバスサイズ）
+        self.guides = None  # 補助線 uint8
+        self.cut = None  # カット線のラスタ uint8
+        self.cut_contour = None  # カット線の外周 (N, 1, 2) int32
+        self.pedestals = []  # 印刷レイヤーに貼る台座 [(PIL画像, (x, y))]
+        self.pedestal_fill = None  # 台座部分のグレー塗り（多角形 (N, 2) int32）
+        self.base_position = None
+
+        # 各レイヤーの由来を表すキャッシュキー（"artwork", "outline", "combine"）
+        self.keys = {}
+
+    def copy(self):
+        # レイヤーの配列は書き換えずに差し替えるので浅いコピーで十分
+        doc = copy.copy(self)
+        doc.pedestals = list(self.pedestals)
+        doc.keys = dict(self.keys)
+        return doc
+
+    def artwork_key(self):
+        # 絵柄の画素ハッシュ（必要になったときに1回だけ計算する）
+        if "artwork" not in self.keys:
+            self.keys["artwork"] = array_digest(self.artwork)
+        return self.keys["artwork"]
+
+    def clear_combined(self):
+        # 台座合成で作ったレイヤーを捨てる（輪郭線の作り直しや台座の変更時）
+        self.canvas_size = (self.artwork.shape[1], self.artwork.shape[0])
+        self.guides = None
+        self.cut = None
+        self.cut_contour = None
+        self.pedestals = []
+        self.pedestal_fill = None
+        self.base_position = None
+        self.keys.pop("combine", None)
+
+    def content_box(self):
+        # 印刷レイヤーで透明でない部分（絵柄の不透明部分＋台座）を含む範囲 (x, y, w, h)
+        w, h = self.canvas_size
+        boxes = [cv2.boundingRect(cv2.extractChannel(self.artwork, 3))]
+        boxes += [(x, y) + pedestal.size for pedestal, (x, y) in self.pedestals]
+        if self.pedestal_fill is not None:
+            boxes.append(cv2.boundingRect(self.pedestal_fill))
+        boxes = [b for b in boxes if b[2] > 0 and b[3] > 0]
+        if not boxes:
+            return 0, 0, w, h
+        x0 = max(0, min(b[0] for b in boxes))
+        y0 = max(0, min(b[1] for b in boxes))
+        x1 = min(w, max(b[0] + b[2] for b in boxes))
+        y1 = min(h, max(b[1] + b[3] for b in boxes))
+        if x1 <= x0 or y1 <= y0:
+            return 0, 0, w, h
+        return int(x0), int(y0), int(x1 - x0), int(y1 - y0)
+
+    def print_layer(self, box=None):
+        # 出力に埋め込む画像（絵柄＋台座）。補助線やカット線は含めない
+        # box: (x, y, w, h) を指定するとキャンバスのその範囲だけを作る
+        x, y, w, h = box or ((0, 0) + tuple(self.canvas_size))
+        canvas = Image.new("RGBA", (w, h), (0, 0, 0, 0))
+        canvas.paste(Image.fromarray(self.artwork[y:y+h, x:x+w]), (0, 0))
+        for pedestal, (px, py) in self.pedestals:
+            canvas.paste(pedestal, (px - x, py - y), pedestal)
+        if self.pedestal_fill is not None:
+            # 配列に変換せず、キャンバスに直接塗る
+            ImageDraw.Draw(canvas).polygon([(px - x, py - y) for px, py in self.pedestal_fill.tolist()],
+                                           fill=PEDESTAL_FILL)
+        return canvas
+
+    def composite(self):
+        # 表示用の画像。印刷レイヤーの上に輪郭リング・補助線・カット線を色付きで重ねる
+        canvas_np = np.array(self.print_layer())
+        if self.cut is None:
+            _paint(canvas_np, self.ring, RING_COLOR)
+        _paint(canvas_np, self.guides, GUIDE_COLOR)
+        _paint(canvas_np, self.cut, CUT_COLOR)
+        return Image.fromarray(canvas_np)
+
+
+def to_rgba_array(image, band_pixels=1_000_000):
+    # PIL 画像を (H, W, 4) の配列にする
+    # np.array(image) は画像全体のバイト列を経由して一時的に2倍以上のメモリを使うので、
+    # 帯ごとに変換して確保済みの配列に書き込む
+    w, h = image.size
+    out = np.empty((h, w, 4), np.uint8)
+    rows = max(1, band_pixels // max(1, w))
+    for y in range(0, h, rows):
+        band = image.crop((0, y, w, min(h, y + rows)))
+        out[y:y + band.height] = np.asarray(band if band.mode == "RGBA" else band.convert("RGBA"))
+    return out
+
+
+def _paint(canvas_np, layer, color):
+    if layer is None:
+        return
+    h = min(canvas_np.shape[0], layer.shape[0])
+    w = min(canvas_np.shape[1], layer.shape[1])
+    canvas_np[:h, :w][layer[:h, :w] > 0] = color
+
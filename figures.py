@@ -0,0 +1,215 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import memory
+import pipeline
+import profiling
+import tiles
+from cache import make_key
+from document import CutDocument
+
+# 1枚の画像に複数のキャラクターが描かれたシート
+# 二値マスクと輪郭リングはシート全体で1回だけ作り、キャラクター＋輪郭リングのつながった塊ごとに
+# 切り出したドキュメントで 補助線 → 台座合成 → SVG出力 を並列に行う
+
+# 最も大きいキャラクターに対する面積の比。これより小さい塊（ゴミ・飛び散った点）は無視する
+MIN_AREA_RATIO = 0.02
+# 切り出す範囲の上下左右の余白 [px]
+FIGURE_MARGIN = 10
+# 1つのSVGにまとめるときのキャラクター同士の間隔 [px]
+FIGURE_SPACING = 20
+
+
+@profiling.profiled()
+def find_figures(doc, min_area=None):
+    # 輪郭リングまで作ったシートから、キャラクターの塊の範囲 (x, y, w, h) と塊の番号を読み順で返す
+    # min_area: 塊の最小面積 [px]（None なら最も大きい塊の MIN_AREA_RATIO 倍）
+    # 戻り値: (ラベル画像（subject_box の範囲）, subject_box, [(x, y, w, h, ラベル)])
+    img_h, img_w = doc.artwork.shape[:2]
+    sx, sy, sw, sh = doc.subject_box or (0, 0, img_w, img_h)
+    memory.require(sw * sh * 5, "キャラクターの検出")
+    silhouette = memory.buffer("figures", (sh, sw))
+    cv2.bitwise_or(doc.mask[sy:sy+sh, sx:sx+sw], doc.ring[sy:sy+sh, sx:sx+sw], dst=silhouette)
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(silhouette, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    if len(areas) == 0:
+        return labels, (sx, sy, sw, sh), []
+    if min_area is None:
+        min_area = areas.max() * MIN_AREA_RATIO
+    boxes = [
+        (int(x) + sx, int(y) + sy, int(w), int(h), label)
+        for label, (x, y, w, h, area) in enumerate(stats[1:, :5], start=1)
+        if area >= min_area
+    ]
+    profiling.annotate(components=n - 1, figures=len(boxes), min_area=float(min_area))
+    return labels, (sx, sy, sw, sh), reading_order(boxes)
+
+
+def reading_order(boxes):
+    # 上の段から順に、同じ段（最初の塊と縦に重なるもの）の中では左から並べる
+    rows = []
+    for box in sorted(boxes, key=lambda b: b[1]):
+        if rows and box[1] < rows[-1][0][1] + rows[-1][0][3]:
+            rows[-1].append(box)
+        else:
+            rows.append([box])
+    return [box for row in rows for box in sorted(row, key=lambda b: b[0])]
+
+
+def crop(array, box):
+    # array の (x, y, w, h) の範囲を切り出す（画像の外にはみ出した部分は0で埋める）
+    x, y, w, h = box
+    out = np.zeros((h, w) + array.shape[2:], array.dtype)
+    ih, iw = array.shape[:2]
+    x0, y0, x1, y1 = max(0, x), max(0, y), min(iw, x + w), min(ih, y + h)
+    if x1 > x0 and y1 > y0:
+        out[y0 - y:y1 - y, x0 - x:x1 - x] = array[y0:y1, x0:x1]
+    return out
+
+
+def figure_document(doc, labels, origin, figure, min_width=0):
+    # シートからキャラクター1体分のドキュメントを切り出す（マスクと輪郭リングはシートのものを使う）
+    # labels / origin: find_figures() のラベル画像とその左上の座標、figure: (x, y, w, h, ラベル)
+    # min_width: 台座が収まるように切り出す最小の幅 [px]（キャラクターの中央に合わせて広げる）
+    x, y, w, h, label = figure
+    width = max(w + 2 * FIGURE_MARGIN, min_width)
+    box = (x + w // 2 - width // 2, y - FIGURE_MARGIN, width, h + 2 * FIGURE_MARGIN)
+    ox, oy = origin
+    own = crop(labels, (box[0] - ox, box[1] - oy) + box[2:])
+    other = (own != 0) & (own != label)
+    own = own == label
+
+    artwork = crop(doc.artwork, box)
+    mask = crop(doc.mask, box)
+    # 近くにある他のキャラクターの絵柄は印刷しない
+    artwork[other & (mask > 0), 3] = 0
+    mask[~own] = 0
+    ring = crop(doc.ring, box)
+    ring[~own] = 0
+
+    fig = CutDocument(Image.fromarray(artwork, "RGBA"))
+    fig.mask, fig.ring = mask, ring
+    fig.subject_box = (x - box[0], y - box[1], w, h)
+    if "outline" in doc.keys:
+        fig.keys["outline"] = make_key("figure", doc.keys["outline"], box=list(box), label=list(figure[:4]))
+    return fig, box
+
+
+def figure_path(path, number):
+    # 出力先 path の拡張子の前にキャラクターの番号を付ける（名前.svg → 名前_01.svg）
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{number:02d}{ext}"
+
+
+def export_figures(doc, pedestals, out_paths, progress=None, cache=None, min_area=None,
+                   single_file=False, workers=None, tolerance=pipeline.CUT_TOLERANCE, print_layer=True):
+    # 輪郭リングまで作ったシートのキャラクターごとに、out_paths の台座で台座合成してSVGに出力する
+    # out_paths: {台座: 出力パス}。single_file=False ならキャラクターごとに 名前_01.svg … を、
+    #   True なら全キャラクターを並べた1つのSVGを出力パスに書き出す
+    #   （single_file=False なら出力パスの拡張子で DXF / PDF も選べる。print_layer は PDF に印刷画像を入れるか）
+    # 戻り値: 書き出したファイルのリスト
+    labels, (sx, sy, _, _), found = find_figures(doc, min_area)
+    if not found:
+        raise ValueError("キャラクターが見つかりませんでした")
+    bases = list(out_paths)
+    # 台座（外側のカット線の余白を含む）が切り出した範囲に収まる幅
+    min_width = max(pedestals.size(base)[0] for base in bases) + 2 * FIGURE_MARGIN
+
+    def run(i):
+        fig, _ = figure_document(doc, labels, (sx, sy), found[i], min_width)
+        guides = pipeline.guide_geometry(fig)
+        results = {}
+        for base in bases:
+            variant = pipeline.combine_base(fig, pedestals.get(base), pedestals.size(base), cache=cache,
+                                            guides=guides)
+            if single_file:
+                results[base] = (variant, pipeline.cut_path(variant, tolerance, cache))
+            else:
+                path = figure_path(out_paths[base], i + 1)
+                pipeline.export_file(variant, path, tolerance=tolerance, cache=cache, print_layer=print_layer)
+                results[base] = path
+        return results
+
+    # 切り出したキャラクターは小さいので、シート全体のレイヤーよりも少ないメモリで並列に処理できる
+    largest = max(w * h for _, _, w, h, _ in found)
+    workers = min(len(found), workers or tiles.workers(),
+                  memory.parallel(len(found), largest * (pipeline.LAYER_BYTES + 8) * len(bases)))
+    if workers <= 1:
+        results = []
+        for i in range(len(found)):
+            pipeline.report(progress, i / len(found), f"キャラクター {i + 1}/{len(found)}")
+            results.append(run(i))
+    else:
+        # 計測中なら、キャラクターごとのステージはワーカーのスレッドの区間として同じ記録に残す
+        with ThreadPoolExecutor(workers, thread_name_prefix="figure") as pool:
+            results = list(pool.map(profiling.propagate(run), range(len(found))))
+
+    if not single_file:
+        return [r[base] for r in results for base in bases]
+    for base in bases:
+        pipeline.report(progress, 0.9, f"台座 {base} のSVG書き込み")
+        write_figures_svg(out_paths[base], [r[base] for r in results], doc.canvas_size[0])
+    return [out_paths[base] for base in bases]
+
+
+def figure_extent(doc):
+    # 印刷画像とカット線を含む範囲 (x, y, w, h)
+    boxes = [doc.content_box()]
+    if doc.cut_contour is not None:
+        boxes.append(cv2.boundingRect(doc.cut_contour))
+    x0 = min(b[0] for b in boxes)
+    y0 = min(b[1] for b in boxes)
+    x1 = max(b[0] + b[2] for b in boxes)
+    y1 = max(b[1] + b[3] for b in boxes)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def shelf_layout(sizes, width, spacing=FIGURE_SPACING):
+    # (幅, 高さ) を左から順に並べ、幅 width を超えたら次の段に送る
+    # 戻り値: (各図形の左上 [(x, y)], 全体の (幅, 高さ))
+    positions = []
+    x = y = row_h = used_w = 0
+    for w, h in sizes:
+        if x > 0 and x + w > width:
+            x, y, row_h = 0, y + row_h + spacing, 0
+        positions.append((x, y))
+        used_w = max(used_w, x + w)
+        row_h = max(row_h, h)
+        x += w + spacing
+    return positions, (used_w, y + row_h)
+
+
+@profiling.profiled()
+def write_figures_svg(file_path, figures, width, spacing=FIGURE_SPACING):
+    # figures: [(台座合成したドキュメント, cut_path() の結果)] を段に並べて1つのSVGに書き出す
+    # 各キャラクターは <g transform="translate(...)"> の中に単体のSVGと同じ座標系で置く
+    extents = [figure_extent(doc) for doc, _ in figures]
+    positions, (total_w, total_h) = shelf_layout([e[2:] for e in extents], width, spacing)
+    profiling.annotate(figures=len(figures), width=total_w, height=total_h)
+    with open(file_path, 'w') as f:
+        pipeline.write_svg_header(f, total_w, total_h)
+        for i, ((doc, path), (ex, ey, _, _), (px, py)) in enumerate(zip(figures, extents, positions)):
+            f.write(f'  <g id="figure-{i + 1:02d}" transform="translate({px - ex} {py - ey})">\n')
+            image, box = pipeline.print_image(doc)
+            pipeline.write_svg_figure(f, image, box, path, indent="    ")
+            f.write('  </g>\n')
+        f.write('</svg>')
+
+
+def process_sheet(in_path, out_paths, pedestals, cache=None, workers=None,
+                  gap=pipeline.OUTLINE_GAP, thickness=pipeline.OUTLINE_THICKNESS, min_area=None, single_file=False,
+                  tolerance=pipeline.CUT_TOLERANCE, print_layer=True):
+    # 複数キャラクターのシート1枚分の 輪郭線作成（シート全体で1回） → キャラクターごとの台座合成 → SVG出力
+    try:
+        doc = CutDocument(pipeline.load_image(in_path))
+        doc = pipeline.create_outline(doc, cache=cache, gap=gap, thickness=thickness)
+        return export_figures(doc, pedestals, out_paths, cache=cache, min_area=min_area,
+                              single_file=single_file, workers=workers, tolerance=tolerance,
+                              print_layer=print_layer)
+    finally:
+        # 作業用の配列はシート1枚ごとに手放す
+        memory.release()
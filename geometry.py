@@ -0,0 +1,211 @@
+import cv2
+import numpy as np
+
+# カット線（輪郭）からSVGパスを作るための幾何計算
+# 点列はすべて (N, 2) の配列で扱い、Pythonの点ごとのループを使わずに計算する
+
+
+# 許容誤差つきの曲線当てはめ（プロッタ用にノード数を減らす）
+# 1. Douglas-Peucker で輪郭を折れ線に間引き、曲がり角（CORNER_ANGLE 以上曲がる頂点）で区切る
+# 2. 1本の直線で済む区間は L、それ以外は元の点列に3次ベジェを最小二乗で当てはめ、
+#    誤差が tolerance を超える区間は誤差が最大の点で分けて当てはめ直す（Schneider の方法）
+# どの点もパスから tolerance 以内に収まる（ベジェの誤差は対応するパラメータの点との距離で測るので安全側）
+
+# 曲がり角とみなす折れ線の頂点の角度 [度]
+CORNER_ANGLE = 50
+# 端の接線を求めるときに参照する点の数（画素の段差で向きがぶれないように少し離れた点を使う）
+TANGENT_SPAN = 4
+# 当てはめ直し（パラメータの再推定）の回数
+REFIT_ITERATIONS = 4
+
+
+def bezier_points(ctrl, u):
+    # 制御点 (4, 2) の3次ベジェのパラメータ u (M,) での点 (M, 2)
+    u = u[:, None]
+    v = 1 - u
+    return v ** 3 * ctrl[0] + 3 * v * v * u * ctrl[1] + 3 * v * u * u * ctrl[2] + u ** 3 * ctrl[3]
+
+
+def _unit(v):
+    n = np.hypot(v[0], v[1])
+    return v / n if n > 0 else v
+
+
+def _tangent(pts, i, direction):
+    # pts[i] から direction（+1: 後ろ, -1: 前）の方向の単位接線
+    j = min(len(pts) - 1, max(0, i + direction * TANGENT_SPAN))
+    return _unit(pts[j] - pts[i])
+
+
+def _chord_params(pts):
+    d = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(pts, axis=0).T))])
+    return d / d[-1] if d[-1] > 0 else np.linspace(0.0, 1.0, len(pts))
+
+
+def _fit_one(pts, u, t1, t2):
+    # 端点と端の接線 t1, t2 を固定して、内側の制御点までの距離を最小二乗で求める
+    p0, p3 = pts[0], pts[-1]
+    v = 1 - u
+    b1, b2 = 3 * v * v * u, 3 * v * u * u
+    a1, a2 = b1[:, None] * t1, b2[:, None] * t2
+    rest = pts - ((v ** 3 + b1)[:, None] * p0 + (b2 + u ** 3)[:, None] * p3)
+    c11, c12, c22 = (a1 * a1).sum(), (a1 * a2).sum(), (a2 * a2).sum()
+    x1, x2 = (a1 * rest).sum(), (a2 * rest).sum()
+    det = c11 * c22 - c12 * c12
+    seg = np.hypot(*(p3 - p0))
+    alpha1 = alpha2 = 0.0
+    if det != 0:
+        alpha1, alpha2 = (x1 * c22 - x2 * c12) / det, (c11 * x2 - c12 * x1) / det
+    if alpha1 < 1e-6 * seg or alpha2 < 1e-6 * seg:
+        # 解が不安定なときは弦の1/3を使う
+        alpha1 = alpha2 = seg / 3
+    return np.array([p0, p0 + t1 * alpha1, p3 + t2 * alpha2, p3])
+
+
+def _reparameterize(ctrl, pts, u):
+    # Newton 法で各点に最も近いベジェ上のパラメータに近づける
+    q = bezier_points(ctrl, u)
+    d1 = 3 * np.diff(ctrl, axis=0)
+    d2 = 2 * np.diff(d1, axis=0)
+    uu = u[:, None]
+    q1 = (1 - uu) ** 2 * d1[0] + 2 * (1 - uu) * uu * d1[1] + uu ** 2 * d1[2]
+    q2 = (1 - uu) * d2[0] + uu * d2[1]
+    diff = q - pts
+    num = (diff * q1).sum(axis=1)
+    den = (q1 * q1).sum(axis=1) + (diff * q2).sum(axis=1)
+    step = np.divide(num, den, out=np.zeros_like(num), where=den != 0)
+    return np.clip(u - step, 0.0, 1.0)
+
+
+def _fit_error(ctrl, pts, u):
+    # 各点とベジェ上の対応する点との距離。点と点の間で曲線が膨らまないように、
+    # 隣り合う点の中点と中間のパラメータの点との距離も見て、大きい方を前の点の誤差にする
+    err = np.hypot(*(bezier_points(ctrl, u) - pts).T)
+    mid = np.hypot(*(bezier_points(ctrl, (u[:-1] + u[1:]) / 2) - (pts[:-1] + pts[1:]) / 2).T)
+    err[:-1] = np.maximum(err[:-1], mid)
+    return err
+
+
+def fit_cubics(pts, t1, t2, tolerance):
+    # 開いた点列 pts を tolerance 以内の3次ベジェの列で近似する。戻り値: 制御点 (4, 2) のリスト
+    if len(pts) <= 2:
+        seg = np.hypot(*(pts[-1] - pts[0])) / 3
+        return [np.array([pts[0], pts[0] + t1 * seg, pts[-1] + t2 * seg, pts[-1]])]
+    u = _chord_params(pts)
+    ctrl = _fit_one(pts, u, t1, t2)
+    err = _fit_error(ctrl, pts, u)
+    for _ in range(REFIT_ITERATIONS):
+        if err.max() <= tolerance or err.max() > tolerance * 4:
+            break
+        u = _reparameterize(ctrl, pts, u)
+        ctrl = _fit_one(pts, u, t1, t2)
+        err = _fit_error(ctrl, pts, u)
+    if err.max() <= tolerance:
+        return [ctrl]
+    # 誤差が最大の点で分け、そこでの接線を両側で共有する（滑らかにつながる）
+    split = int(np.clip(np.argmax(err), 1, len(pts) - 2))
+    center = _unit(pts[max(0, split - TANGENT_SPAN)] - pts[min(len(pts) - 1, split + TANGENT_SPAN)])
+    return fit_cubics(pts[:split + 1], t1, center, tolerance) + fit_cubics(pts[split:], -center, t2, tolerance)
+
+
+def corner_indices(pts, tolerance, corner_angle=CORNER_ANGLE):
+    # 閉じた点列を Douglas-Peucker（cv2.approxPolyDP）で間引いた頂点の番号と、そのうち曲がり角の印
+    approx = cv2.approxPolyDP(pts.astype(np.float32).reshape(-1, 1, 2), tolerance, True)
+    # approxPolyDP は頂点の座標だけを返すので、座標 → 元の点列での番号 の表で番号に戻す
+    # （細い突起では同じ座標を2回通るので、前の頂点から先で一番近い番号を選ぶ）
+    where = {}
+    for i, p in enumerate(pts.astype(np.float32).tolist()):
+        where.setdefault(tuple(p), []).append(i)
+    vertices = [where.get(tuple(v), []) for v in approx.reshape(-1, 2).tolist()]
+    n = len(pts)
+    first = vertices[0][0]
+    idx, pos = [], -1
+    for hits in vertices:
+        ahead = [(i - first) % n for i in hits if (i - first) % n > pos]
+        if ahead:
+            pos = min(ahead)
+            idx.append((pos + first) % n)
+    idx = np.array(sorted(idx))
+    prev = pts[idx] - pts[np.roll(idx, 1)]
+    nxt = pts[np.roll(idx, -1)] - pts[idx]
+    cos = (prev * nxt).sum(axis=1) / np.maximum(np.hypot(*prev.T) * np.hypot(*nxt.T), 1e-12)
+    return idx, cos < np.cos(np.radians(corner_angle))
+
+
+def fit_segments(contour, tolerance):
+    # 閉じた輪郭を、どの点も tolerance [px] 以内に収まる直線・3次ベジェの列にする
+    # 戻り値: (始点 (2,), [区間]) 区間は直線なら終点 (1, 2)、ベジェなら制御点2つと終点 (3, 2)
+    # 最後の区間の終点は始点に戻る（SVG・PDF では閉じる命令を付けて書き出す）
+    pts = np.asarray(contour, np.float64).reshape(-1, 2)
+    keep = np.any(pts != np.roll(pts, 1, axis=0), axis=1)
+    pts = pts[keep] if keep.any() else pts[:1]
+    if len(pts) < 3:
+        return pts[0], [pts[i:i + 1] for i in range(1, len(pts))]
+
+    idx, corners = corner_indices(pts, tolerance)
+    if corners.any():
+        # 最初の曲がり角から始まるように回し、曲がり角ごとに区切る
+        start = idx[np.argmax(corners)]
+        idx = (idx - start) % len(pts)
+        order = np.argsort(idx)
+        idx, corners = idx[order], corners[order]
+        pts = np.roll(pts, -start, axis=0)
+    ring = np.vstack([pts, pts[:1]])
+    vertices = list(idx) + [len(pts)]
+    breaks = [v for v, c in zip(vertices, list(corners) + [True]) if c] if corners.any() else [0, len(pts)]
+
+    segments = []
+    for a, b in zip(breaks[:-1], breaks[1:]):
+        inner = [v for v in vertices if a < v < b]
+        if not inner:
+            # Douglas-Peucker で1本の直線になった区間
+            segments.append(ring[b:b + 1])
+            continue
+        run = ring[a:b + 1]
+        if corners.any():
+            t1, t2 = _tangent(run, 0, 1), _tangent(run, len(run) - 1, -1)
+        else:
+            # 曲がり角の無い閉じた曲線は、始点の前後をつなぐ接線を両端で共有する
+            t1 = _unit(ring[TANGENT_SPAN] - ring[-1 - TANGENT_SPAN])
+            t2 = -t1
+        segments.extend(ctrl[1:] for ctrl in fit_cubics(run, t1, t2, tolerance))
+    return ring[0], segments
+
+
+def segments_to_path(start, segments):
+    # fit_segments() の結果をSVGのパス文字列にする（絶対座標の M / L / C / Z）
+    parts = ["M" + _xy(start)]
+    for seg in segments:
+        parts.append((" L" if len(seg) == 1 else " C") + " ".join(_xy(p) for p in seg))
+    parts.append("Z")
+    return "".join(parts)
+
+
+def flatten_segments(start, segments, tolerance):
+    # fit_segments() の結果を、ベジェからのずれが tolerance [px] 以内の閉じた折れ線 (N, 2) にする（始点は繰り返さない）
+    out = [np.asarray(start, np.float64)[None]]
+    cur = out[0][0]
+    for seg in segments:
+        if len(seg) == 3:
+            ctrl = np.vstack([cur, seg])
+            # 等間隔に n 分割したときのずれは 最大の2階差分 × 3 / (4 n^2) 以下
+            bend = np.hypot(*np.diff(ctrl, 2, axis=0).T).max()
+            n = max(1, int(np.ceil(np.sqrt(0.75 * bend / tolerance))))
+            out.append(bezier_points(ctrl, np.arange(1, n + 1) / n))
+        else:
+            out.append(seg)
+        cur = seg[-1]
+    pts = np.vstack(out)
+    return pts[:-1] if len(pts) > 1 and np.array_equal(pts[-1], pts[0]) else pts
+
+
+def fit_path(contour, tolerance):
+    # 閉じた輪郭を、どの点も tolerance [px] 以内に収まる直線・3次ベジェのSVGパスにする
+    # 戻り値: (パス文字列, ノード数)
+    start, segments = fit_segments(contour, tolerance)
+    return segments_to_path(start, segments), len(segments)
+
+
+def _xy(p):
+    # 座標は 0.01px 単位に丸めて短く書く
+    return ",".join(f"{v:.2f}".rstrip("0").rstrip(".") for v in p)
@@ -0,0 +1,94 @@
+import itertools
+
+import pipeline
+import proxy
+from document import CutDocument
+
+# 処理ステージの依存関係グラフ
+#   読み込み → 輪郭リング（二値マスクを含む） → 補助線 → 台座合成（カット線） → カットパス（SVG）
+# 各ノードは最後に計算した結果を覚えておき、上流のノードかパラメータが変わったときだけ計算し直す
+# （台座だけを変えた場合は マスク・輪郭リング・補助線 を使い回し、台座合成から下だけを作り直す）
+
+
+class StageGraph:
+    def __init__(self, **params):
+        self.params = dict(params)
+        self.nodes = {}  # 名前 -> (関数, 上流ノード名, 使うパラメータ名)
+        self.memo = {}  # 名前 -> (入力の署名, 版数, 結果)
+        self._versions = itertools.count(1)
+
+    def add(self, name, fn, deps=(), params=()):
+        # fn(*上流ノードの結果, progress=..., **パラメータ) を name のノードとして登録する
+        for dep in deps:
+            if dep not in self.nodes:
+                raise KeyError(f"未登録のステージです: {dep}")
+        self.nodes[name] = (fn, tuple(deps), tuple(params))
+        self.memo.pop(name, None)
+
+    def set(self, **params):
+        # パラメータを変える。結果の破棄は get() のときに署名を比べて行う
+        for name in params:
+            if name not in self.params:
+                raise KeyError(f"未登録のパラメータです: {name}")
+        self.params.update(params)
+
+    def signature(self, name):
+        # 上流ノードの版数とパラメータの値の組（同じならノードの結果は変わらない）
+        _, deps, params = self.nodes[name]
+        return (tuple(self.memo[d][1] for d in deps), tuple(self.params[p] for p in params))
+
+    def get(self, name, progress=None):
+        # name の結果を返す。必要な上流ノードから順に、入力が変わったものだけを計算する
+        fn, deps, params = self.nodes[name]
+        values = [self.get(d, progress) for d in deps]
+        sig = self.signature(name)
+        memo = self.memo.get(name)
+        if memo is not None and memo[0] == sig:
+            return memo[2]
+        value = fn(*values, progress=progress, **{p: self.params[p] for p in params})
+        self.memo[name] = (sig, next(self._versions), value)
+        return value
+
+
+def keep_mask(doc, result):
+    # 二値マスクは gap / thickness に依存しないので、上流のドキュメントに残して次の作り直しで使い回す
+    # （マスクは輪郭リングのキャッシュが外れたときだけ create_outline の中で作る）
+    if doc.mask is None:
+        doc.mask = result.mask
+    return result
+
+
+def cut_graph(pedestals, cache=None):
+    # 本番解像度のステージと、プロキシ（縮小画像）で試すプレビュー用のステージを1つのグラフにまとめる
+    # パラメータ: path（画像ファイル）, gap / thickness（輪郭リング）, base（台座の種類）
+    # プレビュー用のノードは "preview_" を付けた名前で、同じパラメータを縮小率に合わせて使う
+    g = StageGraph(path=None, gap=pipeline.OUTLINE_GAP, thickness=pipeline.OUTLINE_THICKNESS, base=None)
+
+    def outline(doc, gap, thickness, progress=None):
+        return keep_mask(doc, pipeline.create_outline(doc, progress, cache, gap, thickness))
+
+    def combined(doc, guides, base, progress=None):
+        return pipeline.combine_base(doc, pedestals.get(base), pedestals.size(base), progress, cache, guides)
+
+    def preview_outline(doc, scaled, gap, thickness, progress=None):
+        gap, thickness = proxy.scale_offsets(gap, thickness, scaled[1])
+        return keep_mask(doc, pipeline.create_outline(doc, progress, gap=gap, thickness=thickness))
+
+    def preview_combined(doc, guides, scaled, base, progress=None):
+        small, size = proxy.scale_pedestal(pedestals.get(base), pedestals.size(base), scaled[1])
+        return pipeline.combine_base(doc, small, size, progress, guides=guides)
+
+    # 読み込んだ PIL 画像は絵柄の配列にした時点で手放す（ノードの結果として覚えておかない）
+    g.add("document", lambda path, progress=None: CutDocument(pipeline.load_image(path)), params=("path",))
+    g.add("outline", outline, deps=("document",), params=("gap", "thickness"))
+    g.add("guides", pipeline.guide_geometry, deps=("outline",))
+    g.add("combined", combined, deps=("outline", "guides"), params=("base",))
+    g.add("cut_path", lambda doc, progress=None: pipeline.cut_path(doc, cache=cache), deps=("combined",))
+
+    g.add("proxy", lambda doc, progress=None: proxy.make_proxy(doc), deps=("document",))
+    g.add("preview_document", lambda scaled, progress=None: scaled[0], deps=("proxy",))
+    g.add("preview_outline", preview_outline, deps=("preview_document", "proxy"), params=("gap", "thickness"))
+    g.add("preview_guides", pipeline.guide_geometry, deps=("preview_outline",))
+    g.add("preview_combined", preview_combined, deps=("preview_outline", "preview_guides", "proxy"),
+          params=("base",))
+    return g
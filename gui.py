@@ -0,0 +1,521 @@
+import tkinter as tk
+from tkinter import ttk, filedialog
+from PIL import Image, ImageTk
+import os
+import sys
+import time
+from tkinterdnd2 import DND_FILES
+
+import display
+import memory
+import pipeline
+import proxy
+from cache import ResultCache
+from graph import cut_graph
+from pedestal import PedestalLibrary
+from profiling import Profiler
+from worker import StageWorker
+
+# GUI（Tk）の画面。batch / nest / serve では読み込まないので、Tk が無い環境でもそれらは動く
+
+class ImageProcessingApp:
+    def __init__(self, root, trace_dir=None):
+        self.root = root
+        # trace_dir を指定すると、ジョブごとの計測結果をコンソールとトレースファイルに出力する
+        self.trace_dir = trace_dir
+        self.root.title("画像処理システム")
+        self.root.minsize(1200, 800)
+
+        # 画像保持用
+        self.image_size = None  # 読み込んだ画像の (幅, 高さ)
+        self.document = None  # 本番解像度で最後に作ったレイヤー（CutDocument）
+        # ステージの依存関係グラフ（台座の変更では マスク・輪郭リング を作り直さない）
+        # 大きな画像では "preview_" のステージを縮小した画像で試し、
+        # 本番解像度の self.target は出力・確定のときに作る
+        self.graph = None
+        self.target = "document"  # 操作者が最後に実行したステージ
+        self.preview_scale = 1.0  # 縮小不要な画像では 1.0
+        self.outlined_image = None
+        self.current_display_image = None
+        self.zoom_factor = 1.0
+        self.min_zoom = 0.1
+        self.max_zoom = 5.0
+
+        # プレビュー描画（縮小ピラミッドから表示範囲だけをリサンプル）
+        self.renderer = display.ZoomRenderer()
+        self.hq_render_delay = 150  # ホイール停止後に高品質描画するまでの待ち時間(ms)
+        self._hq_render_job = None
+
+        # 輪郭リングのパラメータ（調整可能）。"1px" や "2mm" のように指定する
+        self.gap = pipeline.OUTLINE_GAP  # キャラクターからリングまでの隙間
+        self.thickness = pipeline.OUTLINE_THICKNESS  # リングの太さ
+
+        # 実行ファイルのディレクトリを取得
+        self.application_path = pipeline.get_application_path()
+        if getattr(sys, 'frozen', False):
+            print("Running as EXE. Path:", self.application_path)
+        else:
+            print("Running as Script. Path:", self.application_path)
+
+        # assets ディレクトリの存在確認
+        assets_dir = pipeline.get_assets_dir(self.application_path)
+        if not os.path.exists(assets_dir):
+            print(f"Warning: Assets directory not found at {assets_dir}")
+        else:
+            print(f"Assets directory found at {assets_dir}")
+            print("Contents:", os.listdir(assets_dir))
+
+        # 台座関連の設定（assets内の台座画像は起動時に1回だけ読み込む）
+        self.pedestals = PedestalLibrary(assets_dir).preload()
+        self.base_var = tk.StringVar(value="16mm")
+        self.preview_var = tk.BooleanVar(value=True)
+        self.base_parts = self.pedestals.paths
+        self.base_sizes = self.pedestals.sizes
+
+        # ステージ結果のディスクキャッシュ（作れない環境ではキャッシュなしで動かす）
+        try:
+            self.cache = ResultCache()
+        except OSError as e:
+            print("Warning: result cache disabled:", e)
+            self.cache = None
+        self.graph = cut_graph(self.pedestals, self.cache)
+
+        # GUI レイアウト
+        self.main_frame = ttk.Frame(self.root, padding="20")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.root.grid_columnconfigure(0, weight=1)
+        self.root.grid_rowconfigure(0, weight=1)
+        self.main_frame.grid_columnconfigure(0, weight=1)
+        self.main_frame.grid_columnconfigure(1, weight=1)
+        self.main_frame.grid_rowconfigure(0, weight=1)
+
+        # 左側：アップロード＆操作
+        self.left_frame = ttk.Frame(self.main_frame)
+        self.left_frame.grid(row=0, column=0, padx=10, pady=5, sticky="nsew")
+        self.left_frame.grid_columnconfigure(0, weight=1)
+
+        # 画像アップロード
+        self.upload_frame = ttk.LabelFrame(self.left_frame, text="画像アップロード", padding="20")
+        self.upload_frame.grid(row=0, column=0, sticky="nsew")
+        self.upload_frame.grid_columnconfigure(0, weight=1)
+        self.upload_frame.grid_rowconfigure(0, weight=1)
+
+        style = ttk.Style()
+        style.configure("Drop.TLabel", font=("Helvetica", 11), foreground='#666666')
+        style.configure("Upload.TButton", padding=5, font=("Helvetica", 10), background='white', relief='solid')
+        style.configure("Gray.TButton", padding=10, background='#808080')
+
+        self.drop_area = ttk.Label(
+            self.upload_frame,
+            text="\n\nドラッグ＆ドロップで画像をアップロード\n\nまたは",
+            padding="50",
+            relief="solid",
+            style="Drop.TLabel"
+        )
+        self.drop_area.grid(row=0, column=0, padx=20, pady=(20,5), sticky="nsew")
+
+        self.select_btn = ttk.Button(
+            self.upload_frame,
+            text="ファイルを選択",
+            command=self.select_file,
+            style="Upload.TButton"
+        )
+        self.select_btn.grid(row=1, column=0, pady=(0,20))
+
+        # 操作フレーム
+        self.operation_frame = ttk.LabelFrame(self.left_frame, text="操作", padding="20")
+        self.operation_frame.grid(row=1, column=0, pady=(10,0), sticky="ew")
+        for i in range(3):
+            self.operation_frame.grid_columnconfigure(i, weight=1)
+
+        self.outline_btn = ttk.Button(
+            self.operation_frame,
+            text="輪郭線作成",
+            style="Gray.TButton",
+            width=15,
+            command=self.create_outline,
+            state="disabled"
+        )
+        self.outline_btn.grid(row=0, column=0, padx=5)
+
+        self.combine_btn = ttk.Button(
+            self.operation_frame,
+            text="台座合成",
+            style="Gray.TButton",
+            width=15,
+            command=self.toggle_base_options,
+            state="disabled"
+        )
+        self.combine_btn.grid(row=0, column=1, padx=5)
+
+        self.output_btn = ttk.Button(
+            self.operation_frame,
+            text="画像出力",
+            style="Gray.TButton",
+            width=15,
+            command=self.export_to_svg,
+            state="disabled"
+        )
+        self.output_btn.grid(row=0, column=2, padx=5)
+
+        self.selected_base_label = ttk.Label(
+            self.operation_frame,
+            text="選択中の台座: 16mm",
+            font=("Helvetica", 9),
+            foreground='#666666'
+        )
+        self.selected_base_label.grid(row=1, column=0, columnspan=3, pady=(5,0))
+
+        # 台座オプション（ラジオ＆実行）
+        self.base_options_frame = ttk.Frame(self.operation_frame)
+        for size in self.pedestals.keys():
+            rbtn = ttk.Radiobutton(
+                self.base_options_frame,
+                text=f"台座 {size}",
+                variable=self.base_var,
+                value=size,
+                command=self.update_selected_base_label
+            )
+            rbtn.pack(anchor="w", pady=5)
+        self.apply_base_btn = ttk.Button(
+            self.base_options_frame,
+            text="合成実行",
+            command=self.combine_base
+        )
+        self.apply_base_btn.pack(pady=5)
+        # 全サイズの台座で合成したSVGをまとめて出力（見比べ用）
+        self.export_all_btn = ttk.Button(
+            self.base_options_frame,
+            text="全台座で出力",
+            command=self.export_all_bases
+        )
+        self.export_all_btn.pack(pady=5)
+        self.base_options_frame.grid_remove()
+
+        # 進捗表示（処理はバックグラウンドのワーカーで実行）
+        self.progress_frame = ttk.Frame(self.operation_frame)
+        self.progress_frame.grid(row=3, column=0, columnspan=3, pady=(10,0), sticky="ew")
+        self.progress_frame.grid_columnconfigure(0, weight=1)
+        self.progress_bar = ttk.Progressbar(self.progress_frame, mode="determinate", maximum=100)
+        self.progress_bar.grid(row=0, column=0, sticky="ew")
+        self.cancel_btn = ttk.Button(
+            self.progress_frame,
+            text="中止",
+            command=self.cancel_jobs,
+            state="disabled"
+        )
+        self.cancel_btn.grid(row=0, column=1, padx=(5,0))
+        self.status_label = ttk.Label(
+            self.progress_frame,
+            text="待機中",
+            font=("Helvetica", 9),
+            foreground='#666666'
+        )
+        self.status_label.grid(row=1, column=0, columnspan=2, sticky="w")
+        self.worker = StageWorker(self.root, on_progress=self.on_job_progress, on_idle=self.on_jobs_idle)
+
+        # 低解像度プレビューの切り替えと、本番解像度での確定
+        self.preview_check = ttk.Checkbutton(
+            self.operation_frame,
+            text="高速プレビュー（低解像度）",
+            variable=self.preview_var
+        )
+        self.preview_check.grid(row=4, column=0, columnspan=2, pady=(10,0), sticky="w")
+        self.commit_btn = ttk.Button(
+            self.operation_frame,
+            text="本番解像度で確定",
+            command=self.commit_full_resolution,
+            state="disabled"
+        )
+        self.commit_btn.grid(row=4, column=2, pady=(10,0))
+
+        # 右側：結果表示
+        self.result_frame = ttk.LabelFrame(self.main_frame, text="処理結果", padding="20")
+        self.result_frame.grid(row=0, column=1, padx=10, pady=5, sticky="nsew")
+        self.result_frame.grid_columnconfigure(0, weight=1)
+        self.result_frame.grid_rowconfigure(0, weight=1)
+
+        self.result_label = ttk.Label(
+            self.result_frame,
+            text="画像を処理するとここに表示されます",
+            padding="100",
+            relief="groove",
+            anchor="center",
+            justify="center"
+        )
+        self.result_label.grid(row=0, column=0, sticky="nsew", padx=10, pady=10)
+        self.result_label.bind('<MouseWheel>', self.on_mousewheel)
+        self.result_label.bind('<Button-4>', self.on_mousewheel)
+        self.result_label.bind('<Button-5>', self.on_mousewheel)
+        self.result_label.bind('<Configure>', self.on_display_resize)
+
+        self.drop_area.drop_target_register(DND_FILES)
+        self.drop_area.dnd_bind('<<Drop>>', self.handle_drop)
+        self.drop_area.dnd_bind('<<DragEnter>>', self.handle_drag_enter)
+        self.drop_area.dnd_bind('<<DragLeave>>', self.handle_drag_leave)
+
+    def toggle_base_options(self):
+        if self.base_options_frame.winfo_ismapped():
+            self.base_options_frame.grid_remove()
+        else:
+            self.base_options_frame.grid(row=2, column=0, columnspan=3, pady=(10,0))
+
+    def update_selected_base_label(self, *args):
+        self.selected_base_label.configure(text=f"選択中の台座: {self.base_var.get()}")
+
+    def select_file(self):
+        path = filedialog.askopenfilename(filetypes=[("Image files","*.png *.jpg *.jpeg *.bmp"),("All","*.*")])
+        if path:
+            class E: pass
+            e = E(); e.data = path
+            self.handle_drop(e)
+
+    def handle_drop(self, event):
+        fp = event.data.strip('{}').strip('"')
+
+        # 画像の差し替えも待ち行列に入れ、実行中の処理が終わってから反映する
+        def run(ctx):
+            # 前の画像の作業用配列はワーカーのスレッドに残っているので、差し替える前に手放す
+            memory.release()
+            self.graph.set(path=fp)
+            # ドキュメントを初期化（絵柄レイヤーのみ）
+            self.document = self.graph.get("document")
+            self.target = "document"
+            self.image_size = self.document.canvas_size
+            self.preview_scale = proxy.proxy_scale(self.image_size)
+            # 表示用の画像は絵柄の配列と領域を共有する（読み込んだ画像を別に持たない）
+            return Image.fromarray(self.document.artwork)
+
+        def done(img):
+            self.update_image_display(img)
+            self.outline_btn.configure(state="normal")
+            self.combine_btn.configure(state="normal")
+            self.output_btn.configure(state="normal")
+            self.commit_btn.configure(state="normal")
+
+        def error(e, detail):
+            print("Error loading:", e)
+            self.status_label.configure(text=f"読み込みエラー: {e}")
+
+        self.submit_job("画像読み込み", run, done, error)
+
+    def handle_drag_enter(self, event):
+        self.drop_area.configure(relief="sunken")
+    def handle_drag_leave(self, event):
+        self.drop_area.configure(relief="solid")
+
+    def update_image_display(self, pil_img, scale=1.0):
+        # scale: プレビュー画像の縮小率（表示は本来の解像度と同じ大きさにする）
+        self.current_display_image = pil_img
+        self.renderer.set_image(pil_img, scale)
+        self.render_display(display.HIGH)
+
+    def get_viewport(self):
+        w, h = self.result_label.winfo_width(), self.result_label.winfo_height()
+        if w <= 1 or h <= 1:
+            return None  # まだ画面に配置されていない
+        return w, h
+
+    def render_display(self, quality):
+        self._hq_render_job = None
+        img = self.renderer.render(self.zoom_factor, self.get_viewport(), quality)
+        if img is None:
+            return
+        photo = ImageTk.PhotoImage(img)
+        self.result_label.configure(image=photo, text="", padding=0)
+        self.result_label.image = photo
+
+    def schedule_hq_render(self):
+        if self._hq_render_job is not None:
+            self.root.after_cancel(self._hq_render_job)
+        self._hq_render_job = self.root.after(self.hq_render_delay, self.render_display, display.HIGH)
+
+    def on_mousewheel(self, event):
+        if not self.current_display_image: return
+        if hasattr(event,'delta'):
+            self.zoom_factor *= 1.1 if event.delta>0 else 0.9
+        else:
+            self.zoom_factor *= 1.1 if event.num==4 else 0.9
+        self.zoom_factor = max(self.min_zoom, min(self.max_zoom, self.zoom_factor))
+        # ホイール操作中は低品質で即時描画し、止まったら高品質で描き直す
+        self.render_display(display.FAST)
+        self.schedule_hq_render()
+
+    def on_display_resize(self, event):
+        if self.current_display_image:
+            self.schedule_hq_render()
+
+    def submit_job(self, name, run, on_done=None, on_error=None):
+        # run(ctx) はワーカースレッドで順番に実行される
+        # 画像の状態（image_size / document）の更新もワーカー側で行い、UIは表示だけを更新する
+        def done(result):
+            self.status_label.configure(text=f"{name}: 完了")
+            if on_done:
+                on_done(result)
+
+        if self.trace_dir:
+            run = self.profile_job(name, run)
+        self.worker.submit(name, run, done, on_error, self.on_job_cancelled)
+        self.cancel_btn.configure(state="normal")
+        pending = self.worker.pending()
+        if pending > 1:
+            self.status_label.configure(text=f"{name} を待ち行列に追加（{pending} 件）")
+
+    def profile_job(self, name, run):
+        # ワーカースレッド上で run を計測し、終わったら（失敗・中止でも）結果を書き出す
+        def profiled_run(ctx):
+            prof = Profiler(name)
+            try:
+                with prof:
+                    return run(ctx)
+            finally:
+                print(f"[profile] {name}")
+                print(prof.summary())
+                stamp = time.strftime("%Y%m%d-%H%M%S")
+                path = os.path.join(self.trace_dir, f"{stamp}_{name}.trace.json")
+                try:
+                    prof.write_trace(path)
+                except OSError as e:
+                    print("Warning: failed to write trace:", e)
+        return profiled_run
+
+    def cancel_jobs(self):
+        self.worker.cancel_all()
+
+    def on_job_progress(self, job, fraction, message):
+        self.progress_bar.configure(value=fraction * 100)
+        text = f"{job.name}: {message}" if message else f"{job.name}"
+        waiting = self.worker.pending() - 1
+        if waiting > 0:
+            text += f"（待ち {waiting} 件）"
+        self.status_label.configure(text=text)
+
+    def on_job_cancelled(self):
+        self.status_label.configure(text="中止しました")
+
+    def on_jobs_idle(self):
+        self.progress_bar.configure(value=0)
+        self.cancel_btn.configure(state="disabled")
+
+    def on_stage_error(self, stage, e, detail):
+        print(f"Error in {stage}:", e)
+        print(detail)
+        self.status_label.configure(text=f"エラー: {e}")
+
+    def use_preview(self):
+        # メモリの上限（--max-rss-mb）に本番解像度が収まらない画像は、チェックを外していてもプレビューで表示する
+        if self.preview_scale >= 1.0 or self.image_size is None:
+            return False
+        return self.preview_var.get() or not proxy.fits_full_resolution(self.image_size)
+
+    def show_result(self, result):
+        image, scale = result
+        self.update_image_display(image, scale)
+
+    def run_stage(self, ctx, target, preview, **params):
+        # パラメータを反映して target まで実行する（変わっていないステージは前回の結果を使う）
+        self.graph.set(**params)
+        self.target = target
+        if preview:
+            doc = self.graph.get("preview_" + target, ctx)
+            # 縮小率はメモリの空きで変わることがあるので、実際に作ったプロキシのものを使う
+            return doc.composite(), self.graph.get("proxy", ctx)[1]
+        return self.build_full_resolution(ctx).composite(), 1.0
+
+    def create_outline(self):
+        preview = self.use_preview()
+        gap, thickness = self.gap, self.thickness
+
+        def run(ctx):
+            # 表示用の合成もワーカー側で済ませる
+            return self.run_stage(ctx, "outline", preview, gap=gap, thickness=thickness)
+
+        self.submit_job("輪郭線作成", run, self.show_result,
+                        lambda e, detail: self.on_stage_error("create_outline", e, detail))
+
+    def combine_base(self):
+        # 台座はボタンを押した時点の選択を使う
+        key = self.base_var.get()
+        if self.pedestals.get(key) is None:
+            print("Pedestal image not found:", key)
+        preview = self.use_preview()
+        gap, thickness = self.gap, self.thickness
+
+        def run(ctx):
+            # プレビューでは台座も同じ縮小率にして合成する（カット線は出力時に本番解像度で作る）
+            return self.run_stage(ctx, "combined", preview, gap=gap, thickness=thickness, base=key)
+
+        self.submit_job("台座合成", run, self.show_result,
+                        lambda e, detail: self.on_stage_error("combine_base", e, detail))
+
+    def build_full_resolution(self, ctx):
+        # 最後に実行したステージを本番解像度で作る（ワーカースレッドで実行）
+        self.document = self.graph.get(self.target, ctx)
+        if self.document.base_position is not None:
+            # 台座の位置情報を記録
+            self.base_position = self.document.base_position
+        return self.document
+
+    def commit_full_resolution(self):
+        if self.document is None:
+            return
+
+        def run(ctx):
+            return self.build_full_resolution(ctx).composite(), 1.0
+
+        self.submit_job("本番解像度で確定", run, self.show_result,
+                        lambda e, detail: self.on_stage_error("commit", e, detail))
+
+    def export_to_svg(self):
+        if self.document is None:
+            return
+        
+        file_path = filedialog.asksaveasfilename(
+            defaultextension=".svg",
+            filetypes=[("SVG files", "*.svg"), ("DXF files (cut line)", "*.dxf"),
+                       ("PDF files (print + cut layers)", "*.pdf"), ("All files", "*.*")]
+        )
+        
+        if not file_path:
+            return
+
+        def run(ctx):
+            # プレビューで試した内容はここで本番解像度に反映してから出力する
+            doc = self.build_full_resolution(ctx)
+            cut = self.graph.get("cut_path", ctx) if self.target == "combined" else None
+            # 拡張子が .dxf / .pdf ならその形式で出力する
+            pipeline.export_file(doc, file_path, progress=ctx, cache=self.cache, cut=cut)
+            # カット線は輪郭の点数と当てはめたパスのノード数を表示する
+            nodes = f"（カット線 {len(doc.cut_contour)}点 → {cut[1]}ノード）" if cut is not None else ""
+            return file_path, nodes
+
+        def done(result):
+            path, nodes = result
+            self.status_label.configure(text=f"保存しました: {os.path.basename(path)}{nodes}")
+
+        self.submit_job("画像出力", run, done,
+                        lambda e, detail: self.on_stage_error("export_to_svg", e, detail))
+
+    def export_all_bases(self):
+        if self.document is None:
+            return
+        out_dir = filedialog.askdirectory()
+        if not out_dir:
+            return
+        gap, thickness = self.gap, self.thickness
+
+        def run(ctx):
+            # 輪郭線・補助線は1回だけ作り、台座ごとの合成と出力を並列に実行する
+            self.graph.set(gap=gap, thickness=thickness)
+            doc = self.graph.get("outline", ctx)
+            guides = self.graph.get("guides", ctx)
+            stem = os.path.splitext(os.path.basename(self.graph.params["path"]))[0]
+            out_paths = pipeline.variant_paths(out_dir, stem, self.pedestals.keys())
+            pipeline.export_variants(doc, self.pedestals, out_paths, progress=ctx, cache=self.cache, guides=guides)
+            return len(out_paths)
+
+        def done(count):
+            self.status_label.configure(text=f"{count}種類の台座で保存しました: {out_dir}")
+
+        self.submit_job("全台座で出力", run, done,
+                        lambda e, detail: self.on_stage_error("export_all_bases", e, detail))
@@ -0,0 +1,148 @@
+import os
+import threading
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # 任意（/proc も Windows の API も使えない環境で、現在の RSS を測るのに使う）
+    psutil = None
+
+# メモリ節約モード（使用メモリ RSS の上限）
+# 上限を設定すると、大きな一時配列を使う処理は空きに収まるようにタイルを細かくして順に処理し、
+# プレビューは縮小率を上げ、台座ごとの並列出力は同時に走らせる数を減らす
+# どうしても収まらない確保は、プロセスが強制終了される前に MemoryBudgetError で打ち切る
+
+_limit = None  # RSS の上限 [bytes]（None なら制限しない）
+_local = threading.local()
+
+# 上限のうち、確保済みの配列以外の一時的な確保（エンコーダ・ライブラリ内部など）に残しておく割合
+HEADROOM = 0.1
+
+
+class MemoryBudgetError(MemoryError):
+    pass
+
+
+if os.name == "nt":
+    import ctypes
+    from ctypes import wintypes
+
+    class _MemoryCounters(ctypes.Structure):
+        # PROCESS_MEMORY_COUNTERS
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+            (name, ctypes.c_size_t) for name in (
+                "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+    _kernel32 = ctypes.WinDLL("kernel32")
+    _kernel32.GetCurrentProcess.restype = wintypes.HANDLE
+    _psapi = ctypes.WinDLL("psapi")
+    _psapi.GetProcessMemoryInfo.argtypes = [wintypes.HANDLE, ctypes.POINTER(_MemoryCounters), wintypes.DWORD]
+    _psapi.GetProcessMemoryInfo.restype = wintypes.BOOL
+
+
+def _windows_rss():
+    # Windows: 現在のワーキングセット（Linux の RSS に当たる）。取れなければ None
+    counters = _MemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not _psapi.GetProcessMemoryInfo(_kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        return None
+    return counters.WorkingSetSize
+
+
+def set_limit(nbytes):
+    # RSS の上限を設定する（None または 0 で解除）
+    # RSS を測れない環境では上限が効かないので、黙って無視せずに ValueError にする
+    global _limit
+    if nbytes and not supported():
+        raise ValueError("この環境ではメモリ使用量（RSS）を測れないので、メモリ上限は使えません")
+    _limit = int(nbytes) if nbytes else None
+
+
+def supported():
+    # この環境で RSS を測れるか（測れなければメモリ上限は使えない）
+    return rss() is not None
+
+
+def rss():
+    # 現在の RSS [bytes]（Linux は /proc、Windows は GetProcessMemoryInfo、それ以外は psutil）
+    # どれも使えない環境では最大RSS（ru_maxrss）を使う。最大値は減らないので、release() で手放しても
+    # 空きは増えない（上限に近づいたら以後の処理はずっと細かく分けて続けることになる）
+    # 何も測れない環境では None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if os.name == "nt":
+        used = _windows_rss()
+        if used is not None:
+            return used
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+def free():
+    # 上限までの残り [bytes]（上限が無ければ None）
+    if _limit is None:
+        return None
+    return max(0, int(_limit * (1.0 - HEADROOM)) - rss())
+
+
+def fits(nbytes):
+    room = free()
+    return room is None or nbytes <= room
+
+
+def require(nbytes, what):
+    # nbytes の確保が上限に収まらなければ MemoryBudgetError を送出する
+    room = free()
+    if room is not None and nbytes > room:
+        raise MemoryBudgetError(
+            f"{what}: {nbytes / 2**20:.0f}MB 必要ですが、メモリ上限までの残りは {room / 2**20:.0f}MB です")
+
+
+def max_rows(width, bytes_per_row_pixel, count=1, minimum=1):
+    # 幅 width の帯を count 本同時に処理するとき、1本あたりの一時配列が空きに収まる最大の行数
+    # bytes_per_row_pixel: 1画素あたりの一時配列のバイト数（上限が無ければ None）
+    room = free()
+    if room is None:
+        return None
+    return max(minimum, room // max(1, width * bytes_per_row_pixel * count))
+
+
+def parallel(count, nbytes):
+    # 1つあたり nbytes を使う処理を count 個、同時にいくつまで走らせてよいか（最低1）
+    room = free()
+    if room is None:
+        return count
+    return max(1, min(count, room // max(1, nbytes)))
+
+
+def buffer(name, shape, dtype=np.uint8):
+    # スレッドごとに使い回す作業用の配列（内容は不定）
+    # 前回より大きいサイズが必要なときだけ確保し直し、それ以外は同じ領域の先頭を使う
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    pool = getattr(_local, "buffers", None)
+    if pool is None:
+        pool = _local.buffers = {}
+    raw = pool.get(name)
+    if raw is None or raw.size < size:
+        raw = pool[name] = np.empty(size, np.uint8)
+    return raw[:size].view(dtype).reshape(shape)
+
+
+def release():
+    # このスレッドの作業用配列を手放す（次の画像が小さいときにメモリを返す）
+    _local.buffers = {}
@@ -0,0 +1,333 @@
+import argparse
+import math
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+import cv2
+import numpy as np
+
+import profiling
+from offset import length, to_px
+
+# 出力済みのスタンド（カット線で囲まれた部品）をカット用のシートに並べる（面付け）
+# 部品の形はカット線を間引いた多角形で表し、シートは一定の大きさのマス目の占有マップで管理する
+# 部品を置ける位置は「間隔の分だけ太らせた部品のマス目」と占有マップの相関（matchTemplate）が0の位置で、
+# 上の段・左から順に最初に空いている位置に置く（部品は面積の大きい順、向きは90度ずつ回して試す）
+# 例: python app.py nest 出力フォルダ シートの出力先 --sheet 300x450mm --spacing 2mm
+
+SVG_NS = "http://www.w3.org/2000/svg"
+XLINK_NS = "http://www.w3.org/1999/xlink"
+
+# 既定の部品同士・シートの端との間隔
+SPACING = "2mm"
+# 試す回転角度（度）
+ROTATIONS = (0, 90, 180, 270)
+# カット線のベジェ曲線1区間あたりの標本点の数
+CURVE_SAMPLES = 8
+# 部品の多角形を間引くときの許容誤差 [px]
+SIMPLIFY_PX = 1.0
+# 占有マップのマス目の大きさの下限 [px]（大きなシートはマス目の数が MAX_CELLS 程度になるように粗くする）
+MIN_CELL_PX = 4
+MAX_CELLS = 500
+
+SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(mm|px)?\s*x\s*(\d+(?:\.\d+)?)\s*(mm|px)?\s*$", re.IGNORECASE)
+TRANSLATE_PATTERN = re.compile(r"translate\(\s*(-?[\d.]+)[\s,]+(-?[\d.]+)\s*\)")
+PATH_TOKEN = re.compile(r"[MLCZmlcz]|-?\d*\.?\d+(?:[eE][-+]?\d+)?")
+
+
+class Part:
+    # 面付けする部品1つ
+    # outlines: カット線の多角形のリスト（部品の座標系、(N, 2) float64）
+    # image: 印刷画像 (x, y, w, h, base64のPNG) または None、cuts: カット線の <path> の属性のリスト
+    def __init__(self, name, outlines, image, cuts):
+        self.name = name
+        self.outlines = outlines
+        self.image = image
+        self.cuts = cuts
+
+    def area(self):
+        x0, y0, x1, y1 = bounds(self.outlines)
+        return (x1 - x0) * (y1 - y0)
+
+
+def sheet_size(text):
+    # "300x450mm" / "600x400mm" / "3750x5625px" を (幅, 高さ) [px] にする（単位が片方だけなら両方に使う）
+    m = SIZE_PATTERN.match(text)
+    if not m:
+        raise ValueError(f"シートの大きさの指定が不正です: {text!r}（例: 300x450mm）")
+    unit_w, unit_h = m.group(2) or m.group(4) or "px", m.group(4) or m.group(2) or "px"
+    return to_px(m.group(1) + unit_w), to_px(m.group(3) + unit_h)
+
+
+def path_points(d, samples=CURVE_SAMPLES):
+    # SVGパス（export_to_svg が書く絶対座標の M / L / C / Z）を閉じた多角形のリストにする
+    tokens = PATH_TOKEN.findall(d)
+    polys, current, i = [], [], 0
+    cmd = None
+    while i < len(tokens):
+        if tokens[i].isalpha():
+            cmd = tokens[i]
+            i += 1
+            if cmd in "Zz":
+                if len(current) >= 3:
+                    polys.append(np.array(current))
+                current = []
+            continue
+        if cmd == "M" or cmd == "L":
+            current.append((float(tokens[i]), float(tokens[i + 1])))
+            i += 2
+        elif cmd == "C":
+            p0 = np.array(current[-1])
+            c1, c2, p3 = (np.array([float(tokens[i + k]), float(tokens[i + k + 1])]) for k in (0, 2, 4))
+            t = np.linspace(0.0, 1.0, samples + 1)[1:, None]
+            curve = ((1 - t) ** 3) * p0 + 3 * ((1 - t) ** 2) * t * c1 + 3 * (1 - t) * t * t * c2 + t ** 3 * p3
+            current.extend(map(tuple, curve))
+            i += 6
+        else:
+            raise ValueError(f"対応していないパスのコマンドです: {cmd!r}")
+    if len(current) >= 3:
+        polys.append(np.array(current))
+    return polys
+
+
+def simplify(poly, epsilon=SIMPLIFY_PX):
+    # Douglas-Peucker で頂点を間引く（形の誤差は epsilon 以内）
+    approx = cv2.approxPolyDP(poly.astype(np.float32).reshape(-1, 1, 2), epsilon, True)
+    return approx.reshape(-1, 2).astype(np.float64)
+
+
+def bounds(polys):
+    pts = np.concatenate(polys)
+    (x0, y0), (x1, y1) = pts.min(axis=0), pts.max(axis=0)
+    return float(x0), float(y0), float(x1), float(y1)
+
+
+def read_parts(svg_path):
+    # export_to_svg（または figures の1ファイル出力）のSVGから部品を読み込む
+    # <g transform="translate(...)"> があればその1つずつを、無ければファイル全体を1つの部品にする
+    # 埋め込み画像はデコードせず、base64の文字列のまま面付けしたSVGに書き写す
+    root = ET.parse(svg_path).getroot()
+    stem = os.path.splitext(os.path.basename(svg_path))[0]
+    groups = [g for g in root if g.tag == f"{{{SVG_NS}}}g"] or [root]
+    parts = []
+    for i, group in enumerate(groups):
+        m = TRANSLATE_PATTERN.search(group.get("transform", ""))
+        dx, dy = (float(m.group(1)), float(m.group(2))) if m else (0.0, 0.0)
+        cuts = [dict(e.attrib) for e in group if e.tag == f"{{{SVG_NS}}}path"]
+        outlines = [simplify(p + (dx, dy)) for c in cuts for p in path_points(c["d"])]
+        if not outlines:
+            continue
+        for c in cuts:
+            c["transform"] = f"translate({dx:g} {dy:g})"
+        image = None
+        for e in group:
+            if e.tag == f"{{{SVG_NS}}}image":
+                href = e.get(f"{{{XLINK_NS}}}href")
+                image = (float(e.get("x", 0)) + dx, float(e.get("y", 0)) + dy,
+                         float(e.get("width")), float(e.get("height")), href)
+        name = stem if len(groups) == 1 else f"{stem}#{group.get('id', i + 1)}"
+        parts.append(Part(name, outlines, image, cuts))
+    return parts
+
+
+def footprints(part, cell, spacing, rotations=ROTATIONS):
+    # 部品を rotations の角度に回したときの占有マスと、間隔の分だけ太らせた判定用のマス
+    # 戻り値: [(角度, 占有マス, 判定用マス, マス目の左上から部品の座標原点までの位置 [px], 判定用マスの数)]
+    # 細かい画素で塗ってからマス目ごとに「1画素でもあれば占有」にまとめるので、マス目は部品を必ず覆う
+    x0, y0, x1, y1 = bounds(part.outlines)
+    pad = math.ceil((spacing + 1) / cell) * cell
+    w = math.ceil((x1 - x0 + 1 + 2 * pad) / cell) * cell
+    h = math.ceil((y1 - y0 + 1 + 2 * pad) / cell) * cell
+    origin = (pad - math.floor(x0), pad - math.floor(y0))
+    fine = np.zeros((h, w), np.uint8)
+    cv2.fillPoly(fine, [np.round(p + origin).astype(np.int32) for p in part.outlines], 1)
+    # 丸めの誤差（1画素）と間隔の分だけ広げる（太らせる幅が大きいので膨張ではなく距離変換で求める）
+    dist = cv2.distanceTransform(1 - fine, cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+    def cells(a):
+        return a.reshape(h // cell, cell, w // cell, cell).max(axis=(1, 3)).astype(np.float32)
+
+    cells0, grown0 = cells(dist <= 1), cells(dist <= spacing + 1)
+    out = []
+    for angle in rotations:
+        # SVG の rotate(90) は (x, y) → (-y, x)。マス目は np.rot90(k=-1) で同じ向きに回り、
+        # 回した後の範囲が0から始まるように画像の高さだけずらす
+        ox, oy = origin
+        occupied, grown, height = cells0, grown0, h
+        for _ in range(angle // 90):
+            ox, oy = height - oy, ox
+            height = occupied.shape[1] * cell
+            occupied, grown = np.rot90(occupied, -1), np.rot90(grown, -1)
+        out.append((angle, np.ascontiguousarray(occupied), np.ascontiguousarray(grown), (ox, oy),
+                    float(grown.sum())))
+    return out
+
+
+class Sheet:
+    def __init__(self, size, cell):
+        self.size = size
+        self.cell = cell
+        self.grid = np.zeros((int(size[1] // cell), int(size[0] // cell)), np.float32)
+        self.free = float(self.grid.size)  # 空いているマスの数
+        self.placements = []  # [(部品, 角度, (x, y))]（SVG の translate(x y) rotate(角度) で部品を置く）
+
+    def find(self, grown, area):
+        # 判定用マス grown（マスの数 area）を置ける最も上・左のマス目の位置 (x, y)。置けなければ None
+        gh, gw = grown.shape
+        if gh > self.grid.shape[0] or gw > self.grid.shape[1] or self.free < area:
+            return None
+        hits = cv2.matchTemplate(self.grid, grown, cv2.TM_CCORR)
+        free = hits < 0.5
+        rows = np.flatnonzero(free.any(axis=1))
+        if len(rows) == 0:
+            return None
+        y = int(rows[0])
+        return int(np.argmax(free[y])), y
+
+    def place(self, part, angle, cells, origin, at):
+        x, y = at
+        h, w = cells.shape
+        region = self.grid[y:y + h, x:x + w]
+        before = region.sum()
+        np.maximum(region, cells, out=region)
+        self.free -= float(region.sum() - before)
+        self.placements.append((part, angle, (x * self.cell + origin[0], y * self.cell + origin[1])))
+
+    def utilization(self):
+        return float(self.grid.mean())
+
+
+def best_position(sheet, shapes):
+    # shapes: footprints() の向きのうち、下端が最も上になる向きと位置（同じなら左）
+    # 戻り値: (角度, 占有マス, 原点, (x, y)) または None
+    best, best_key = None, None
+    for angle, cells, grown, origin, area in shapes:
+        at = sheet.find(grown, area)
+        if at is None:
+            continue
+        key = (at[1] + cells.shape[0], at[0])
+        if best_key is None or key < best_key:
+            best, best_key = (angle, cells, origin, at), key
+    return best
+
+
+@profiling.profiled()
+def nest(parts, size, spacing=SPACING, rotations=ROTATIONS):
+    # parts をシート（size = (幅, 高さ) [px]）に並べる。1枚に収まらない分は次のシートに置く
+    # 戻り値: (シートのリスト, どのシートにも収まらない部品のリスト)
+    spacing = to_px(spacing)
+    cell = max(MIN_CELL_PX, math.ceil(max(size) / MAX_CELLS))
+    sheets, rejected = [], []
+    shapes_of = {}  # 同じ形の部品（同じSVGを複数枚並べる場合など）はマス目を1回だけ作る
+    for part in sorted(parts, key=Part.area, reverse=True):
+        shape_key = b"".join(p.tobytes() for p in part.outlines)
+        if shape_key not in shapes_of:
+            shapes_of[shape_key] = footprints(part, cell, spacing, rotations)
+        shapes = shapes_of[shape_key]
+        for sheet in sheets:
+            best = best_position(sheet, shapes)
+            if best is not None:
+                break
+        else:
+            sheet = Sheet(size, cell)
+            best = best_position(sheet, shapes)
+            if best is None:
+                rejected.append(part)
+                continue
+            sheets.append(sheet)
+        sheet.place(part, *best)
+    profiling.annotate(parts=len(parts), sheets=len(sheets), cell_px=cell)
+    return sheets, rejected
+
+
+def write_sheet_svg(file_path, sheet):
+    # 面付けしたシートを、印刷レイヤー（print）とカットレイヤー（cut）の2つのグループに分けて書き出す
+    # 印刷画像は各部品のカット線で切り抜く（隣の部品に背景が重ならないように）
+    width, height = (round(v) for v in sheet.size)
+    with open(file_path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n')
+        f.write(f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1">\n')
+        f.write('  <defs>\n')
+        for i, (part, _, _) in enumerate(sheet.placements):
+            f.write(f'    <clipPath id="clip-{i + 1}">\n')
+            for cut in part.cuts:
+                f.write(f'      <path d="{cut["d"]}"{_transform(cut)}/>\n')
+            f.write('    </clipPath>\n')
+        f.write('  </defs>\n')
+
+        f.write('  <g id="print">\n')
+        for i, (part, angle, (x, y)) in enumerate(sheet.placements):
+            if part.image is None:
+                continue
+            ix, iy, iw, ih, href = part.image
+            f.write(f'    <g transform="translate({x:g} {y:g}) rotate({angle})" clip-path="url(#clip-{i + 1})">\n')
+            f.write(f'      <image x="{ix:g}" y="{iy:g}" width="{iw:g}" height="{ih:g}" xlink:href="')
+            f.write(href)
+            f.write('"/>\n')
+            f.write('    </g>\n')
+        f.write('  </g>\n')
+
+        f.write('  <g id="cut">\n')
+        for part, angle, (x, y) in sheet.placements:
+            f.write(f'    <g id="{_escape(part.name)}" transform="translate({x:g} {y:g}) rotate({angle})">\n')
+            for cut in part.cuts:
+                attrs = "".join(f' {k}="{_escape(v)}"' for k, v in cut.items())
+                f.write(f'      <path{attrs}/>\n')
+            f.write('    </g>\n')
+        f.write('  </g>\n')
+        f.write('</svg>')
+
+
+def _transform(cut):
+    return f' transform="{cut["transform"]}"' if "transform" in cut else ""
+
+
+def _escape(text):
+    return str(text).replace("&", "&amp;").replace('"', "&quot;").replace("<", "&lt;")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="app.py nest",
+        description="出力したSVGの部品をカット用のシートに並べ、シートごとに印刷・カットの2レイヤーのSVGを出力する"
+    )
+    parser.add_argument("in_dir", help="部品のSVGフォルダ（export_to_svg / バッチ処理の出力）")
+    parser.add_argument("out_dir", help="シートのSVG出力先フォルダ")
+    parser.add_argument("--sheet", type=sheet_size, default="300x450mm", help="シートの大きさ（例: 300x450mm）")
+    parser.add_argument("--spacing", type=length, default=SPACING, help="部品同士・シートの端との間隔（例: 2mm, 20px）")
+    parser.add_argument("--no-rotate", action="store_true", help="部品を回転しない")
+    return parser
+
+
+def run(in_dir, out_dir, size, spacing=SPACING, rotations=ROTATIONS):
+    # 戻り値: どのシートにも収まらなかった部品の数
+    start = time.perf_counter()
+    parts = []
+    for name in sorted(os.listdir(in_dir)):
+        if name.lower().endswith(".svg"):
+            parts.extend(read_parts(os.path.join(in_dir, name)))
+    if not parts:
+        print(f"No SVG parts found in {in_dir}")
+        return 0
+    read_time = time.perf_counter() - start
+
+    sheets, rejected = nest(parts, size, spacing, rotations)
+    nest_time = time.perf_counter() - start - read_time
+    os.makedirs(out_dir, exist_ok=True)
+    for i, sheet in enumerate(sheets):
+        path = os.path.join(out_dir, f"sheet_{i + 1:02d}.svg")
+        write_sheet_svg(path, sheet)
+        print(f"[OK] {path}: {len(sheet.placements)} parts ({sheet.utilization():.0%} used)")
+    for part in rejected:
+        print(f"[NG] {part.name}: シートに収まりません")
+    print(f"Done: {len(parts)} parts on {len(sheets)} sheets "
+          f"(read {read_time:.2f}s, nest {nest_time:.2f}s, total {time.perf_counter() - start:.2f}s)")
+    return len(rejected)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    rotations = (0,) if args.no_rotate else ROTATIONS
+    return 1 if run(args.in_dir, args.out_dir, args.sheet, args.spacing, rotations) else 0
@@ -0,0 +1,82 @@
+import argparse
+import re
+
+import cv2
+import numpy as np
+
+import tiles
+from pedestal import PX_PER_MM
+
+# キャラクターの外側に一定の距離で輪郭リングを作る
+# マスクの外側の距離変換を1回だけ計算し、距離のしきい値でリングを切り出すので、
+# 隙間や太さを大きくしても（膨張カーネルと違って）処理時間はほぼ変わらない
+
+# 外側の距離がこれ以下なら距離変換より円形カーネルの膨張の方が速い（結果は同じ）
+SMALL_RADIUS = 4
+
+# 長さの指定 "2mm" / "1.5px" / 3（数値だけなら px）
+LENGTH_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(px|mm)?\s*$", re.IGNORECASE)
+
+
+def to_px(length, px_per_mm=PX_PER_MM[0]):
+    # 長さを画素数に換算する（mm は台座画像と同じ 12.5px/mm を既定とする）
+    if isinstance(length, (int, float)):
+        return float(length)
+    m = LENGTH_PATTERN.match(length)
+    if not m:
+        raise ValueError(f"長さの指定が不正です: {length!r}（例: 2mm, 3px）")
+    value, unit = float(m.group(1)), (m.group(2) or "px").lower()
+    return value * px_per_mm if unit == "mm" else value
+
+
+def length(text):
+    # argparse 用: "2mm" / "3px" / "3" を検証して文字列のまま返す
+    try:
+        to_px(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+
+def ring_offsets(gap, thickness, px_per_mm=PX_PER_MM[0]):
+    # gap: キャラクターからリングの内側までの距離、thickness: リングの太さ
+    # 戻り値: リングの (内側, 外側) の距離 [px]
+    inner = to_px(gap, px_per_mm)
+    outer = inner + to_px(thickness, px_per_mm)
+    if outer <= inner:
+        raise ValueError("輪郭リングの太さは0より大きくしてください")
+    return inner, outer
+
+
+def outside_distance(mask):
+    # マスク外の各画素から最も近いキャラクター画素までのユークリッド距離（マスク内は0）
+    return cv2.distanceTransform(cv2.bitwise_not(mask), cv2.DIST_L2, cv2.DIST_MASK_PRECISE)
+
+
+def ring_from_distance(dist, inner, outer):
+    # inner < 距離 <= outer の画素を 255 にした uint8 のリング
+    # inRange は両端を含むので、下限は inner より大きい最小の float32 にする
+    lower = np.nextafter(np.float32(inner), np.float32(np.inf))
+    return cv2.inRange(dist, float(lower), float(outer))
+
+
+def disk(radius):
+    # 中心からのユークリッド距離が radius 以下の画素を 1 にしたカーネル
+    r = int(np.floor(radius))
+    yy, xx = np.mgrid[-r:r + 1, -r:r + 1]
+    return (xx * xx + yy * yy <= radius * radius).astype(np.uint8)
+
+
+def outline_ring(mask, inner, outer, out=None):
+    # 大きなマスクはタイルに分けて並列に処理する。リングは outer 以内のキャラクター画素だけで決まるので、
+    # タイルの上下に outer 行ぶん余分に切り出せば分けない場合と同じ結果になる
+    # out: リングを書き込む配列（キャンバス上の範囲のビューを渡すと、範囲分の一時配列を作らない）
+    if outer <= SMALL_RADIUS:
+        # 距離 <= r の領域は半径 r の円で膨張した領域と一致する
+        k_outer, k_inner = disk(outer), disk(inner)
+        fn = lambda t: cv2.subtract(cv2.dilate(t, k_outer), cv2.dilate(t, k_inner))
+        cost = 3  # 膨張2枚＋差
+    else:
+        fn = lambda t: ring_from_distance(outside_distance(t), inner, outer)
+        cost = 6  # 反転 uint8 ＋ 距離 float32 ＋ リング uint8
+    return tiles.map_rows(fn, mask, halo=int(np.ceil(outer)) + 1, cost=cost, out=out)
@@ -0,0 +1,102 @@
+import os
+import re
+import threading
+
+import cv2
+from PIL import Image
+
+# 台座画像ライブラリ
+# assets/nichidai_base_*mm.png を1回だけ読み込み、base_sizes にリサイズしたRGBA画像を
+# メモリ上に保持して使い回す
+
+BASE_SIZES = {
+    "16mm": (200, 40),
+    "14mm": (175, 35),
+    "12mm": (150, 30),
+    "10mm": (125, 25)
+}
+
+# BASE_SIZES に無いサイズの画像が追加されたときの換算値（16mm → 200x40 と同じ比率）
+PX_PER_MM = (12.5, 2.5)
+
+FILE_PATTERN = re.compile(r"^nichidai_base_(\d+(?:\.\d+)?)mm\.png$", re.IGNORECASE)
+
+
+def default_size(key):
+    mm = float(key[:-2])
+    return round(mm * PX_PER_MM[0]), round(mm * PX_PER_MM[1])
+
+
+def discover(assets_dir):
+    # assets内の台座画像を {"16mm": パス, ...} の形で返す
+    found = {}
+    if not os.path.isdir(assets_dir):
+        return found
+    for name in os.listdir(assets_dir):
+        m = FILE_PATTERN.match(name)
+        if m:
+            found[f"{m.group(1)}mm"] = os.path.join(assets_dir, name)
+    return found
+
+
+def sort_keys(keys):
+    # 大きい台座から順に並べる
+    return sorted(keys, key=lambda k: float(k[:-2]), reverse=True)
+
+
+class PedestalLibrary:
+    def __init__(self, assets_dir, base_sizes=None):
+        self.assets_dir = assets_dir
+        self.sizes = dict(BASE_SIZES if base_sizes is None else base_sizes)
+        self.paths = {}
+        self._sources = {}  # key -> 原寸のRGBA配列
+        self._resized = {}  # (key, (w, h)) -> リサイズ済みのPIL画像
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        # assets を走査し、新しく置かれた台座画像を追加で読み込む
+        with self._lock:
+            for key, path in discover(self.assets_dir).items():
+                if self.paths.get(key) == path and key in self._sources:
+                    continue
+                img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+                if img is None:
+                    print(f"Warning: failed to read pedestal image {path}")
+                    continue
+                if img.ndim == 2:
+                    img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGRA)
+                elif img.shape[2] == 3:
+                    img = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
+                self.paths[key] = path
+                self._sources[key] = cv2.cvtColor(img, cv2.COLOR_BGRA2RGBA)
+                self.sizes.setdefault(key, default_size(key))
+                # 画像が差し替えられた場合に備えて古いリサイズ結果を捨てる
+                for cached in [k for k in self._resized if k[0] == key]:
+                    del self._resized[cached]
+
+    def keys(self):
+        return sort_keys(self.sizes)
+
+    def size(self, key):
+        return self.sizes.get(key, (200, 40))
+
+    def get(self, key, size=None):
+        # 貼り付け用のRGBA画像を返す。画像ファイルが無い台座は None
+        sz = tuple(size) if size is not None else self.size(key)
+        with self._lock:
+            cached = self._resized.get((key, sz))
+            if cached is not None:
+                return cached
+            src = self._sources.get(key)
+            if src is None:
+                return None
+            pedestal = Image.fromarray(cv2.resize(src, sz))
+            self._resized[(key, sz)] = pedestal
+            return pedestal
+
+    def preload(self):
+        # 登録済みの全サイズを先にリサイズしておく
+        for key in self.keys():
+            self.get(key)
+        return self
@@ -0,0 +1,713 @@
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import memory
+import polygon
+import profiling
+import tiles
+from cache import array_digest, make_key
+from document import CutDocument
+from offset import disk, outline_ring, ring_offsets, to_px
+from geometry import CORNER_ANGLE, fit_path, fit_segments, flatten_segments
+from writers import write_dxf, write_pdf, write_png_base64
+
+# GUI（Tk）に依存しない処理ステージ
+# ImageProcessingApp とバッチ処理の両方からこのモジュールを呼び出す
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# 透過PNGでキャラクターとみなすアルファ値の下限
+ALPHA_THRESHOLD = 128
+
+# 輪郭リングの既定値（キャラクターからの隙間, リングの太さ）。"1px" や "0.5mm" で指定する
+OUTLINE_GAP = "1px"
+OUTLINE_THICKNESS = "1.5px"
+
+# カット線は輪郭リングの外周からさらにこの画素数だけ外側を通す
+CUT_MARGIN = 2
+# 表示用のカット線レイヤーの線の太さ
+CUT_LINE_WIDTH = 3
+# カット線のパスが輪郭から離れてよい距離。この範囲で直線と3次ベジェの数が最も少なくなるように当てはめる
+CUT_TOLERANCE = "0.1mm"
+# DXF は曲線を折れ線にして書く。ベジェからのずれの上限（カット線の許容誤差に対する割合）
+DXF_FLATTEN_RATIO = 0.25
+# 出力できるカット線のファイル形式（拡張子で選ぶ）
+EXPORT_FORMATS = (".svg", ".dxf", ".pdf")
+# 輪郭リング・台座合成で作るラスタのレイヤー（マスクとリング、補助線とカット線）の1画素あたりのバイト数
+LAYER_BYTES = 2
+
+
+def get_application_path():
+    if getattr(sys, 'frozen', False):
+        # exeファイルとして実行されている場合
+        return sys._MEIPASS
+    # 通常のPythonスクリプトとして実行されている場合
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def get_assets_dir(application_path=None):
+    return os.path.join(application_path or get_application_path(), "assets")
+
+
+@profiling.profiled()
+def load_image(path):
+    img = Image.open(path)
+    img.load()
+    # パレット・グレースケール画像はRGBAにそろえる
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA")
+    return img
+
+
+def report(progress, fraction, message):
+    # progress: (進捗0～1, メッセージ) を受け取るコールバック
+    # 中止要求があればコールバック側から例外を送出して処理を打ち切る
+    # 計測中なら message をステージ内の処理段階の区切りとして記録する
+    profiling.step(message)
+    if progress is not None:
+        progress(fraction, message)
+
+
+def mask_source(artwork):
+    # 透明な画素がある（透過PNG）ならアルファチャンネルをそのままシルエットに使う
+    # 全面不透明（JPG・背景ありPNG）の場合だけ Otsu の二値化に頼る
+    ranges = tiles.reduce_rows(lambda t: cv2.minMaxLoc(cv2.extractChannel(t, 3))[:2], artwork)
+    lo, hi = min(r[0] for r in ranges), max(r[1] for r in ranges)
+    if lo < 255 and hi >= ALPHA_THRESHOLD:
+        return "alpha"
+    return "otsu"
+
+
+@profiling.profiled()
+def compute_mask(artwork, source=None):
+    # 絵柄 (H, W, 4) RGBA からキャラクターの二値マスクを作る（1枚の画像につき1回だけ呼ぶ）
+    source = source or mask_source(artwork)
+    profiling.annotate(width=artwork.shape[1], height=artwork.shape[0], source=source)
+    # 大きな画像は行方向のタイルに分けて並列に処理する（結果は分けない場合と同じ）
+    # 各タイルは OpenCV の dst= で結果の配列に直接書き込み、タイルごとの一時配列を作らない
+    h, w = artwork.shape[:2]
+    mask = np.empty((h, w), np.uint8)
+    if source == "alpha":
+        def alpha(t, o):
+            cv2.extractChannel(t, 3, dst=o)
+            cv2.threshold(o, ALPHA_THRESHOLD - 1, 255, cv2.THRESH_BINARY, dst=o)
+        return tiles.apply_rows(alpha, artwork, mask)
+
+    # Otsu のしきい値はタイルごとのヒストグラムを合計して画像全体で1つ求める
+    # グレースケールは作業用の配列を使い回す（次の画像でも確保し直さない）
+    gray = tiles.apply_rows(lambda t, o: cv2.cvtColor(t, cv2.COLOR_RGBA2GRAY, dst=o), artwork,
+                            memory.buffer("gray", (h, w)))
+    hist = sum(tiles.reduce_rows(lambda t: np.bincount(t.ravel(), minlength=256), gray))
+    thresh = otsu_threshold(hist)
+    # しきい値より明るい画素（白）が過半数なら背景を拾っているので反転し、暗い側をキャラクターにする
+    mode = cv2.THRESH_BINARY
+    if 255 * hist[thresh + 1:].sum() / gray.size > 127:
+        mode = cv2.THRESH_BINARY_INV
+    return tiles.apply_rows(lambda t, o: cv2.threshold(t, thresh, 255, mode, dst=o), gray, mask)
+
+
+def otsu_threshold(hist):
+    # cv2.threshold(THRESH_OTSU) と同じ計算でヒストグラムからしきい値を求める
+    n = hist.sum()
+    scale = 1.0 / n
+    mu = float(np.dot(np.arange(256, dtype=np.float64), hist)) * scale
+    mu1 = q1 = max_sigma = 0.0
+    max_val = 0
+    eps = float(np.finfo(np.float32).eps)
+    for i in range(256):
+        p_i = hist[i] * scale
+        mu1 *= q1
+        q1 += p_i
+        q2 = 1.0 - q1
+        if min(q1, q2) < eps or max(q1, q2) > 1.0 - eps:
+            continue
+        mu1 = (mu1 + i * p_i) / q1
+        mu2 = (mu - q1 * mu1) / q2
+        sigma = q1 * q2 * (mu1 - mu2) * (mu1 - mu2)
+        if sigma > max_sigma:
+            max_sigma = sigma
+            max_val = i
+    return max_val
+
+
+def find_band_extents(binm_crop, y_start, y_stop):
+    # binm_crop の y_start～y_stop 行に含まれる白画素の最も左と右の列を返す
+    # 白画素が無い場合は (列数, 0) を返す（呼び出し側で足元ラインを流用する）
+    cw = binm_crop.shape[1]
+    if y_start < 0:
+        # 負の開始行は末尾の行を指すため、y_stop までの全行が対象になる
+        y_start = 0
+    band = binm_crop[y_start:y_stop]
+    if band.size == 0:
+        return cw, 0
+    # 列ごとの最大値が255なら、その列に白画素がある
+    cols = np.flatnonzero(band.max(axis=0) == 255)
+    if cols.size == 0:
+        return cw, 0
+    return int(cols[0]), int(cols[-1])
+
+
+def column_top(binm_crop, col, y_start, y_stop):
+    # binm_crop の col 列で y_start～y_stop 行にある最初の白画素の行（無い場合は None）
+    y_start = max(0, y_start)
+    rows = np.flatnonzero(binm_crop[y_start:y_stop, col])
+    return int(rows[0]) + y_start if rows.size else None
+
+
+def hide_under_pedestal(layer, pedestal, pos):
+    # 台座画像の不透明な部分に隠れる線をレイヤーから消す（layerを直接書き換え）
+    x, y = pos
+    pw, ph = pedestal.size
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(layer.shape[1], x + pw), min(layer.shape[0], y + ph)
+    if x1 <= x0 or y1 <= y0:
+        return
+    alpha = np.asarray(pedestal.getchannel("A"))[y0 - y:y1 - y, x0 - x:x1 - x]
+    layer[y0:y1, x0:x1][alpha >= 128] = 0
+
+
+def subject_box(mask, margin=0):
+    # マスクの外接矩形を margin 画素（＋1）広げて画像内に収めた (x, y, w, h)
+    # キャラクターが無い場合は画像全体を返す
+    h, w = mask.shape[:2]
+    x, y, bw, bh = cv2.boundingRect(mask)
+    if bw == 0 or bh == 0:
+        return 0, 0, w, h
+    m = int(np.ceil(margin)) + 1
+    x0, y0 = max(0, x - m), max(0, y - m)
+    x1, y1 = min(w, x + bw + m), min(h, y + bh + m)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+@profiling.profiled()
+def create_outline(doc, progress=None, cache=None, gap=OUTLINE_GAP, thickness=OUTLINE_THICKNESS):
+    # 輪郭リングのレイヤーを作る。台座合成のレイヤーは作り直しになるので捨てる
+    # cache: ResultCache を渡すと、同じ絵柄・パラメータの結果を再利用する
+    # gap / thickness: リングの位置と太さ（px または mm）
+    inner, outer = ring_offsets(gap, thickness)
+    doc = doc.copy()
+    doc.clear_combined()
+    doc.keys.pop("outline", None)
+    profiling.annotate(width=doc.artwork.shape[1], height=doc.artwork.shape[0], ring_px=[inner, outer])
+
+    source = mask_source(doc.artwork)
+    key = None
+    if cache is not None:
+        key = make_key("outline", doc.artwork_key(), mask=source, ring=(inner, outer))
+        hit = cache.get(key)
+        profiling.annotate(cache="miss" if hit is None else "hit")
+        if hit is not None:
+            arrays, meta = hit
+            doc.mask, doc.ring = arrays["mask"], arrays["ring"]
+            box = meta.get("subject_box")
+            doc.subject_box = tuple(box) if box else subject_box(doc.mask, outer)
+            doc.keys["outline"] = key
+            return doc
+
+    # メモリの上限があるときは、マスクとリング（1画素1バイトずつ）が収まらなければここで打ち切る
+    memory.require(doc.artwork.shape[0] * doc.artwork.shape[1] * LAYER_BYTES, "輪郭リング")
+
+    # 1. 二値マスク（絵柄は変わらないので、作り直しのときは前回のマスクを使う）
+    report(progress, 0.0, "二値マスク作成")
+    if doc.mask is None:
+        doc.mask = compute_mask(doc.artwork, source)
+
+    # 2. マスク外側の距離変換から、隙間 inner～outer の範囲をリングとして切り出す
+    #    リングが届く範囲（キャラクターの外接矩形＋outer）だけを処理する
+    report(progress, 0.5, "輪郭リング抽出")
+    doc.subject_box = subject_box(doc.mask, outer)
+    bx, by, bw, bh = doc.subject_box
+    doc.ring = np.zeros_like(doc.mask)
+    outline_ring(doc.mask[by:by+bh, bx:bx+bw], inner, outer, out=doc.ring[by:by+bh, bx:bx+bw])
+    profiling.annotate(subject_box=list(doc.subject_box))
+
+    if key is not None:
+        cache.put(key, {"mask": doc.mask, "ring": doc.ring}, {"subject_box": list(doc.subject_box)})
+        doc.keys["outline"] = key
+    return doc
+
+
+@profiling.profiled()
+def guide_geometry(doc, progress=None):
+    # 輪郭リングまで作ったドキュメントから補助線の座標を求める（台座の種類には依存しない）
+    # 戻り値: {"y_feet", "y_25", "horizontal", "vertical_left", "vertical_right", "contacts", "outlines"}
+    #   （座標は画像全体の座標系）
+    img_h, img_w = doc.artwork.shape[:2]
+
+    # 1. キャラクター＋輪郭リングのシルエット（キャラクターの周りだけ）
+    report(progress, 0.0, "キャラクター輪郭取得")
+    #    手順9 で周りを CUT_MARGIN+1 画素広げて膨張するので、余白付きの作業用配列の内側に直接作る
+    sx, sy, sw, sh = doc.subject_box or (0, 0, img_w, img_h)
+    pad = CUT_MARGIN + 1
+    padded = memory.buffer("silhouette", (sh + 2 * pad, sw + 2 * pad))
+    padded[:pad] = 0
+    padded[-pad:] = 0
+    padded[:, :pad] = 0
+    padded[:, -pad:] = 0
+    silhouette = padded[pad:-pad, pad:-pad]
+    cv2.bitwise_or(doc.mask[sy:sy+sh, sx:sx+sw], doc.ring[sy:sy+sh, sx:sx+sw], dst=silhouette)
+
+    # 2. シルエットの外周を取得（座標は画像全体の座標系）
+    cnts, _ = cv2.findContours(silhouette, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(sx, sy))
+    main = max(cnts, key=cv2.contourArea)
+    profiling.annotate(silhouette_points=len(main))
+
+    # 3. トリミング
+    x, y, w, h = cv2.boundingRect(main)
+
+    # 4. 二値マスク(トリミング後)
+    binm_crop = silhouette[y-sy:y-sy+h, x-sx:x-sx+w]
+
+    # 5. 足元ライン関連
+    y_max = max(pt[0][1] for pt in main)
+    delta = 5
+    feet_pts = [pt[0] for pt in main if pt[0][1] >= y_max - delta]
+    if not feet_pts:
+        feet_pts = [pt[0] for pt in main]
+    x_left = min(p[0] for p in feet_pts)
+    x_right = max(p[0] for p in feet_pts)
+    y_feet = y_max
+
+    # 7. 補助線の位置を計算
+    report(progress, 0.15, "補助線計算")
+    cw = w
+    # "30%上" のライン(y_30)を計算
+    y_25 = int(y_feet * 0.7)
+    if y_25 < 0:
+        y_25 = 0  # 万一マイナスなら補正
+
+    # 30%のラインから足元までの間で最も左端と右端の点を見つける
+    x_left_30, x_right_30 = find_band_extents(binm_crop, y_25 - y, y_feet - y + 1)
+
+    # 見つからなかった場合は足元ラインの左右を流用
+    if x_left_30 == cw:
+        x_left_30 = x_left - x
+    if x_right_30 == 0:
+        x_right_30 = x_right - x
+
+    # 左右の補助線がシルエットに接する点（その列の一番上の白画素）
+    top_left = column_top(binm_crop, x_left_30, y_25 - y, y_feet - y + 1)
+    top_right = column_top(binm_crop, x_right_30, y_25 - y, y_feet - y + 1)
+    contacts = [
+        (x_left_30 + x, y_feet if top_left is None else top_left + y),
+        (x_right_30 + x, y_feet if top_right is None else top_right + y),
+    ]
+
+    # 8. 補助線の座標を定義（元の画像の座標系に変換）
+    # 台座の一番上の水平線
+    horizontal_guide_pedestal = [
+        (x_left_30 + x, y_feet),
+        (x_right_30 + x, y_feet)
+    ]
+    # 左側垂直ライン
+    vertical_left = [
+        (x_left_30 + x, y_25),
+        (x_left_30 + x, y_feet)
+    ]
+    # 右側垂直ライン
+    vertical_right = [
+        (x_right_30 + x, y_25),
+        (x_right_30 + x, y_feet)
+    ]
+
+    # 9. カット線の元になるキャラクターの外周（シルエットを CUT_MARGIN 画素広げた輪郭の多角形）
+    report(progress, 0.2, "キャラクター外周取得")
+    kernel = disk(CUT_MARGIN)
+    cut_area = tiles.map_rows(lambda t: cv2.dilate(t, kernel), padded, halo=CUT_MARGIN + 1, cost=1)
+    outlines, _ = cv2.findContours(cut_area, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE, offset=(sx - pad, sy - pad))
+    profiling.annotate(outline_vertices=sum(len(c) for c in outlines))
+
+    return {
+        "y_feet": y_feet,
+        "y_25": y_25,
+        "horizontal": horizontal_guide_pedestal,
+        "vertical_left": vertical_left,
+        "vertical_right": vertical_right,
+        "contacts": contacts,
+        "outlines": [c.reshape(-1, 2) for c in outlines],
+    }
+
+
+@profiling.profiled()
+def combine_base(doc, pedestal, base_size, progress=None, cache=None, guides=None):
+    # pedestal: PedestalLibrary.get() が返すリサイズ済みの台座画像（画像が無い場合は None）
+    # 台座・補助線・カット線のレイヤーを毎回作り直すので、台座を変えて再実行してよい
+    # guides: guide_geometry() の結果（同じ輪郭で台座だけ変える場合に使い回せる）
+    if doc.ring is None:
+        doc = create_outline(doc, cache=cache)
+    doc = doc.copy()
+    doc.clear_combined()
+    img_h, img_w = doc.artwork.shape[:2]
+    sz = tuple(base_size)
+    profiling.annotate(width=img_w, height=img_h, base_size=list(sz))
+
+    key = None
+    if cache is not None and "outline" in doc.keys:
+        ped_key = array_digest(np.asarray(pedestal)) if pedestal is not None else None
+        key = make_key("combine", doc.keys["outline"], pedestal=ped_key, base_size=sz, cut="polygon")
+        hit = cache.get(key)
+        profiling.annotate(cache="miss" if hit is None else "hit")
+        if hit is not None:
+            restore_combined(doc, hit, pedestal, sz)
+            doc.keys["combine"] = key
+            return doc
+
+    # 1.～9. 補助線の位置とキャラクターの外周（台座によらないので、渡された場合はそれを使う）
+    if guides is None:
+        guides = guide_geometry(doc, progress)
+    y_feet = guides["y_feet"]
+    horizontal_guide_pedestal = guides["horizontal"]
+    vertical_left, vertical_right = guides["vertical_left"], guides["vertical_right"]
+
+    # 6. 台座準備
+    base_pil = pedestal
+    if pedestal is None:
+        pedestal = placeholder_pedestal(sz)
+    pw, ph = pedestal.size
+
+    # 10. 補助線のレイヤー（台座の分だけキャンバスを50px拡張）
+    #    補助線・台座を含む範囲 (rx, ry, rw, rh) だけに描き、最後にキャンバスへ貼り付ける
+    report(progress, 0.3, "補助線レイヤー作成")
+    guide_h = img_h + 50
+    canvas_h = guide_h + 50
+    memory.require(img_w * canvas_h * LAYER_BYTES, "台座合成")
+    rx, ry, rw, rh = combine_region((img_w, canvas_h), horizontal_guide_pedestal + vertical_left + vertical_right,
+                                    base_pil is not None, sz)
+    profiling.annotate(region=[int(v) for v in (rx, ry, rw, rh)])
+
+    guide_img = Image.new("L", (rw, rh), 0)
+    draw = ImageDraw.Draw(guide_img)
+    lw = 3
+    # 台座の水平線と垂直2本を描画
+    draw.line(shift(horizontal_guide_pedestal, rx, ry), fill=255, width=lw)
+    draw.line(shift(vertical_left, rx, ry), fill=255, width=lw)
+    draw.line(shift(vertical_right, rx, ry), fill=255, width=lw)
+    blue_mask = np.array(guide_img)
+
+    # 11. 補助線の矩形の中央に台座を配置（台座に隠れた補助線は消す）
+    base_top_y = horizontal_guide_pedestal[0][1]  # = y_feet
+    left_x, _ = horizontal_guide_pedestal[0]
+    right_x, _ = horizontal_guide_pedestal[1]
+    rect_width = right_x - left_x
+    offset_x = left_x + (rect_width - pw) // 2
+    doc.pedestals.append((pedestal, (offset_x, base_top_y)))
+    hide_under_pedestal(blue_mask, pedestal, (offset_x - rx, base_top_y - ry))
+    doc.canvas_size = (img_w, canvas_h)
+    doc.guides = place(blue_mask, rx, ry, doc.canvas_size)
+
+    # 12. カット線で囲む図形: キャラクターの外周、補助線の四角形、台座の枠
+    #     補助線の四角形は、左右の補助線がキャラクターに接する点から足元までを CUT_MARGIN だけ広げたもの
+    report(progress, 0.5, "台座配置")
+    (cl_x, cl_y), (cr_x, cr_y) = guides["contacts"]
+    shapes = list(guides["outlines"])
+    shapes.append(np.array([
+        [cl_x - CUT_MARGIN, cl_y],
+        [cr_x + CUT_MARGIN, cr_y],
+        [cr_x + CUT_MARGIN, y_feet + CUT_MARGIN],
+        [cl_x - CUT_MARGIN, y_feet + CUT_MARGIN],
+    ]))
+
+    # 台座の配置（1回だけ）
+    pw, ph = sz
+
+    if base_pil is not None:
+        # 台座を画面中央に配置（1回だけ）
+        center_x = img_w // 2
+        base_left_x = center_x - pw // 2
+        doc.pedestals.append((base_pil, (base_left_x, base_top_y)))
+
+        # 台座のカット線は外側の四角形（キャラクターのカット線とつながる）
+        line_thickness = 3
+        outer_margin = line_thickness
+        shapes.append(polygon.rectangle(base_left_x - outer_margin, base_top_y - outer_margin,
+                                        base_left_x + pw + outer_margin, base_top_y + ph + outer_margin))
+
+        # 内側のグレーの四角形（印刷レイヤー）
+        inner_margin = line_thickness // 2
+        inner_pts = np.array([
+            [base_left_x + inner_margin, base_top_y + inner_margin],              # 左上
+            [base_left_x + pw - inner_margin, base_top_y + inner_margin],         # 右上
+            [base_left_x + pw - inner_margin, base_top_y + ph - inner_margin],    # 右下
+            [base_left_x + inner_margin, base_top_y + ph - inner_margin]          # 左下
+        ], np.int32)
+        doc.pedestal_fill = inner_pts
+
+        # 台座の位置情報を記録
+        doc.base_position = {
+            'x': base_left_x,
+            'y': base_top_y,
+            'width': pw,
+            'height': ph
+        }
+
+    # 13. 図形を多角形のまま合体し、最も大きい外周をカット線にする（処理時間は頂点数で決まる）
+    report(progress, 0.75, "カット線作成")
+    loops = polygon.union(shapes)
+    doc.cut = np.zeros((canvas_h, img_w), np.uint8)
+    if loops:
+        # 後段のスムージングに合わせて1画素間隔の点列にし、キャンバスの外に出た点は端に寄せる
+        points = polygon.densify(loops[0])
+        np.clip(points[:, 0], 0, img_w - 1, out=points[:, 0])
+        np.clip(points[:, 1], 0, canvas_h - 1, out=points[:, 1])
+        doc.cut_contour = points.reshape(-1, 1, 2)
+        cv2.polylines(doc.cut, [doc.cut_contour], True, 255, thickness=CUT_LINE_WIDTH)
+        profiling.annotate(cut_vertices=len(loops[0]), cut_points=len(points))
+
+    if key is not None:
+        store_combined(cache, key, doc)
+        doc.keys["combine"] = key
+    return doc
+
+
+def combine_region(canvas_size, guide_pts, with_base, base_size, pad=10):
+    # combine_base で補助線を描く範囲 (x, y, w, h) を求める（補助線と中央の台座を含む）
+    # pad は線の太さの分の余白
+    canvas_w, canvas_h = canvas_size
+    xs = [px for px, _ in guide_pts]
+    ys = [py for _, py in guide_pts]
+    if with_base:
+        bw, bh = base_size
+        base_left_x = canvas_w // 2 - bw // 2
+        base_top_y = max(ys)
+        xs += [base_left_x, base_left_x + bw]
+        ys += [base_top_y + bh]
+    x0, y0 = max(0, min(xs) - pad), max(0, min(ys) - pad)
+    x1, y1 = min(canvas_w, max(xs) + pad), min(canvas_h, max(ys) + pad)
+    return x0, y0, x1 - x0, y1 - y0
+
+
+def shift(points, dx, dy):
+    return [(px - dx, py - dy) for px, py in points]
+
+
+def place(layer, x, y, canvas_size):
+    # 範囲の座標で作ったレイヤーをキャンバスサイズの0埋めレイヤーに貼り付ける
+    w, h = canvas_size
+    out = np.zeros((h, w), dtype=layer.dtype)
+    out[y:y+layer.shape[0], x:x+layer.shape[1]] = layer
+    return out
+
+
+def placeholder_pedestal(size):
+    # 台座画像が無いときに使うグレーの板
+    return Image.new("RGBA", tuple(size), (128, 128, 128, 255))
+
+
+def store_combined(cache, key, doc):
+    arrays = {"guides": doc.guides, "cut": doc.cut}
+    if doc.cut_contour is not None:
+        arrays["cut_contour"] = doc.cut_contour
+    if doc.pedestal_fill is not None:
+        arrays["pedestal_fill"] = doc.pedestal_fill
+    meta = {
+        "canvas_size": list(doc.canvas_size),
+        "pedestal_positions": [[int(x), int(y)] for _, (x, y) in doc.pedestals],
+        "base_position": {k: int(v) for k, v in doc.base_position.items()} if doc.base_position else None,
+    }
+    cache.put(key, arrays, meta)
+
+
+def restore_combined(doc, hit, pedestal, size):
+    # store_combined で保存したレイヤーを doc に戻す（台座画像は呼び出し側のものを使う）
+    arrays, meta = hit
+    doc.guides = arrays["guides"]
+    doc.cut = arrays["cut"]
+    doc.cut_contour = arrays.get("cut_contour")
+    doc.pedestal_fill = arrays.get("pedestal_fill")
+    doc.canvas_size = tuple(meta["canvas_size"])
+    doc.base_position = meta["base_position"]
+    positions = [tuple(p) for p in meta["pedestal_positions"]]
+    # 1つ目は補助線の中央、2つ目（台座画像がある場合のみ）はキャンバス中央に置いた台座
+    first = pedestal if pedestal is not None else placeholder_pedestal(size)
+    doc.pedestals = [(first, positions[0])] + [(pedestal, p) for p in positions[1:]]
+
+
+@profiling.profiled()
+def cut_path(doc, tolerance=CUT_TOLERANCE, cache=None):
+    # カット線のSVGパス文字列とノード数（直線・ベジェの区間の数）を返す。カット線が無い・小さすぎる場合は None
+    # tolerance: パスが輪郭から離れてよい距離（"0.1mm" / "1px"）
+    contour = doc.cut_contour
+    if contour is None or cv2.contourArea(contour) < 100:
+        return None
+    tolerance_px = to_px(tolerance)
+
+    key = None
+    if cache is not None and "combine" in doc.keys:
+        key = make_key("svg_path", doc.keys["combine"], tolerance=tolerance_px, corner_angle=CORNER_ANGLE)
+        hit = cache.get(key)
+        profiling.annotate(cache="miss" if hit is None else "hit")
+        if hit is not None:
+            meta = hit[1]
+            return meta["path"], meta["nodes"]
+
+    # Douglas-Peucker で曲がり角と直線を見つけ、残りを許容誤差内の3次ベジェで当てはめる
+    path_data, nodes = fit_path(contour, tolerance_px)
+    profiling.annotate(contour_points=len(contour), path_nodes=nodes, tolerance_px=tolerance_px)
+
+    if key is not None:
+        cache.put(key, meta={"path": path_data, "nodes": nodes})
+    return path_data, nodes
+
+
+@profiling.profiled()
+def export_to_svg(doc, file_path, progress=None, tolerance=CUT_TOLERANCE, cache=None, cut=None):
+    # tolerance: カット線のパスが輪郭から離れてよい距離
+    # cut: 計算済みの cut_path() の結果（None ならここで計算する）
+    # 埋め込み画像は透明でない範囲だけにして、SVG上の同じ位置に置く
+    report(progress, 0.0, "印刷画像作成")
+    image, box = print_image(doc)
+    path = cut if cut is not None else cut_path(doc, tolerance, cache)
+
+    # SVG作成 - Adobe互換性向上
+    report(progress, 0.3, "SVG書き込み")
+    width, height = doc.canvas_size
+    profiling.annotate(width=width, height=height)
+    with open(file_path, 'w') as f:
+        write_svg_header(f, width, height)
+        write_svg_figure(f, image, box, path)
+        f.write('</svg>')
+
+
+@profiling.profiled()
+def export_to_dxf(doc, file_path, progress=None, tolerance=CUT_TOLERANCE):
+    # カット線だけを mm 単位の DXF に出力する（印刷画像は含めない）
+    report(progress, 0.0, "カット線の当てはめ")
+    segments = cut_segments(doc, tolerance)
+    polylines = []
+    if segments is not None:
+        polylines.append(flatten_segments(*segments, to_px(tolerance) * DXF_FLATTEN_RATIO))
+    report(progress, 0.5, "DXF書き込み")
+    profiling.annotate(vertices=sum(len(p) for p in polylines))
+    with open(file_path, 'w') as f:
+        write_dxf(f, polylines, doc.canvas_size[1])
+
+
+@profiling.profiled()
+def export_to_pdf(doc, file_path, progress=None, tolerance=CUT_TOLERANCE, print_layer=True):
+    # カット線（直線・ベジェのまま）と、print_layer=True なら印刷画像をレイヤーに分けてPDFに出力する
+    report(progress, 0.0, "カット線の当てはめ")
+    segments = cut_segments(doc, tolerance)
+    image = box = None
+    if print_layer:
+        report(progress, 0.2, "印刷画像作成")
+        image, box = print_image(doc)
+    report(progress, 0.4, "PDF書き込み")
+    with open(file_path, 'wb') as f:
+        write_pdf(f, doc.canvas_size, [segments] if segments is not None else [], image, box)
+
+
+def export_file(doc, file_path, progress=None, tolerance=CUT_TOLERANCE, cache=None, cut=None, print_layer=True):
+    # 出力先の拡張子（EXPORT_FORMATS）で SVG / DXF / PDF を選んで出力する
+    # cut: 計算済みの cut_path() の結果（SVG のときだけ使う）、print_layer: PDF に印刷画像を入れるか
+    ext = os.path.splitext(file_path)[1].lower()
+    if ext == ".dxf":
+        export_to_dxf(doc, file_path, progress, tolerance)
+    elif ext == ".pdf":
+        export_to_pdf(doc, file_path, progress, tolerance, print_layer)
+    else:
+        export_to_svg(doc, file_path, progress, tolerance, cache, cut)
+
+
+def cut_segments(doc, tolerance=CUT_TOLERANCE):
+    # カット線を直線・3次ベジェの列 (始点, [区間]) にする。カット線が無い・小さすぎる場合は None
+    contour = doc.cut_contour
+    if contour is None or cv2.contourArea(contour) < 100:
+        return None
+    return fit_segments(contour, to_px(tolerance))
+
+
+def print_image(doc):
+    # 出力に埋め込む印刷画像（透明でない範囲だけ）と、その範囲 (x, y, w, h)
+    box = doc.content_box()
+    memory.require(box[2] * box[3] * 4, "印刷画像")
+    return doc.print_layer(box), box
+
+
+def write_svg_header(f, width, height):
+    # SVGヘッダー - Adobe互換性のためXML宣言を追加
+    f.write(f'<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n')
+    f.write(f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" version="1.1">\n')
+
+
+def write_svg_figure(f, image, box, path, indent="  "):
+    # 印刷画像と cut_path() の結果（None ならカット線なし）の要素を書き込む
+    bx, by, bw, bh = box
+
+    # 元画像を埋め込み（一時ファイルを使わず、メモリ上でエンコードしながら少しずつ書き込む）
+    position = f'x="{bx}" y="{by}" ' if bx or by else ''
+    f.write(f'{indent}<image {position}width="{bw}" height="{bh}" xlink:href="data:image/png;base64,')
+    write_png_base64(f, image)
+    f.write('"/>\n')
+
+    # 輪郭線を追加
+    if path is None:
+        return
+    path_data, nodes = path
+    # ノード数が十分あるか確認
+    if nodes >= 4:
+        # パスを書き込み（線の結合方法も調整）
+        f.write(f'{indent}<path d="{path_data}" stroke="#000000" stroke-width="0.5" fill="none" stroke-linejoin="round" stroke-linecap="round" stroke-miterlimit="10"/>\n')
+    else:
+        # ノード数が少ない場合
+        f.write(f'{indent}<path d="{path_data}" stroke="#000000" stroke-width="0.5" fill="none"/>\n')
+
+
+def variant_paths(out_dir, stem, bases, ext=".svg"):
+    # 台座ごとの出力先 {台座: out_dir/stem_台座.svg}
+    return {base: os.path.join(out_dir, f"{stem}_{base}{ext}") for base in bases}
+
+
+def export_variants(doc, pedestals, out_paths, progress=None, cache=None, guides=None, workers=None,
+                    tolerance=CUT_TOLERANCE, print_layer=True):
+    # 輪郭線まで作ったドキュメントに台座を1種類ずつ合成して、それぞれSVGに出力する
+    # pedestals: PedestalLibrary、out_paths: {台座: 出力パス}
+    # 輪郭リング・補助線は1回だけ計算し、台座ごとの 台座合成 → SVG出力 はスレッドで並列に実行する
+    # 戻り値: {台座: カット線の外周 (N, 1, 2)}
+    if doc.ring is None:
+        doc = create_outline(doc, cache=cache)
+    if guides is None:
+        guides = guide_geometry(doc)
+
+    def run(base):
+        variant = combine_base(doc, pedestals.get(base), pedestals.size(base), cache=cache, guides=guides)
+        export_file(variant, out_paths[base], tolerance=tolerance, cache=cache, print_layer=print_layer)
+        return base, variant.cut_contour
+
+    bases = list(out_paths)
+    # メモリの上限があるときは、台座合成のレイヤーと印刷画像が同時に収まる数だけ並列にする
+    w, h = doc.canvas_size
+    variant_bytes = w * (h + 100) * (LAYER_BYTES + 4)
+    workers = min(len(bases), workers or tiles.workers(), memory.parallel(len(bases), variant_bytes))
+    contours = {}
+    if workers <= 1:
+        # 並列にしない場合は呼び出し元のスレッドで実行する
+        for i, base in enumerate(bases):
+            report(progress, i / len(bases), f"台座 {base}")
+            contours.update([run(base)])
+        return contours
+    # 計測中なら、台座ごとのステージはワーカーのスレッドの区間として同じ記録に残す
+    run = profiling.propagate(run)
+    with ThreadPoolExecutor(workers, thread_name_prefix="variant") as pool:
+        futures = [pool.submit(run, base) for base in bases]
+        for i, future in enumerate(as_completed(futures)):
+            base, contour = future.result()
+            contours[base] = contour
+            report(progress, (i + 1) / len(bases), f"台座 {base} 出力完了")
+    return {base: contours[base] for base in bases}
+
+
+def process_variants(in_path, out_paths, pedestals, cache=None, workers=None,
+                     gap=OUTLINE_GAP, thickness=OUTLINE_THICKNESS, tolerance=CUT_TOLERANCE, print_layer=True):
+    # 1枚分の 輪郭線作成 → 台座合成 → SVG出力 を out_paths の台座ごとに行う（輪郭線は共通）
+    try:
+        doc = CutDocument(load_image(in_path))
+        doc = create_outline(doc, cache=cache, gap=gap, thickness=thickness)
+        return export_variants(doc, pedestals, out_paths, cache=cache, workers=workers, tolerance=tolerance,
+                               print_layer=print_layer)
+    finally:
+        # 作業用の配列は画像1枚ごとに手放す（次の画像が小さいときに大きい領域を持ち越さない）
+        memory.release()
@@ -0,0 +1,271 @@
+import math
+
+import numpy as np
+
+# 多角形の和（ユニオン）
+# キャラクターの輪郭ポリゴンと補助線・台座の矩形を頂点の座標だけで合体し、外周の閉じた輪郭を求める
+# 処理時間は画素数ではなく頂点数で決まる
+# 入力の頂点は整数座標を前提にしていて、交差・重なりの判定（外積）は float64 でも誤差なく計算できる
+# 交点は辺の組ごとに1回だけ計算し、両方の辺で同じ値を使うので、辺をつなぐときに座標が一致する
+
+# 交差判定で一度に比べる辺の数（メモリ使用量の上限）
+CHUNK = 512
+
+
+def signed_area(poly):
+    # 靴ひも公式。正なら x 軸から y 軸へ回る向き
+    x, y = poly[:, 0], poly[:, 1]
+    return 0.5 * float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+
+def rectangle(x0, y0, x1, y1):
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], np.float64)
+
+
+def prepare(poly):
+    # (N, 2) の float64 にして、重複する頂点を除き、向きを面積が正になる向きに揃える
+    pts = np.asarray(poly, np.float64).reshape(-1, 2)
+    if len(pts) > 1:
+        keep = np.any(pts != np.roll(pts, 1, axis=0), axis=1)
+        pts = pts[keep] if keep.any() else pts[:1]
+    if len(pts) < 3:
+        return None
+    area = signed_area(pts)
+    if area == 0:
+        return None
+    return pts if area > 0 else pts[::-1].copy()
+
+
+def cross(ax, ay, bx, by):
+    return ax * by - ay * bx
+
+
+def bbox(poly):
+    return poly.min(axis=0), poly.max(axis=0)
+
+
+def boxes_overlap(a, b):
+    return bool(np.all(a[0] <= b[1]) and np.all(b[0] <= a[1]))
+
+
+def edges_near(poly, box):
+    # box と外接矩形が重なる辺の番号
+    p, q = poly, np.roll(poly, -1, axis=0)
+    lo, hi = np.minimum(p, q), np.maximum(p, q)
+    return np.flatnonzero(np.all(lo <= box[1], axis=1) & np.all(hi >= box[0], axis=1))
+
+
+def intersect(i, a, j, b, splits, shared):
+    # 多角形 a（番号 i）と b（番号 j）の辺の交点・重なりを求めて
+    # splits[k][辺] に (t, 点)、shared[k][辺] に (t0, t1, 同じ向きか, 相手の番号) を追加する
+    ea = edges_near(a, bbox(b))
+    eb = edges_near(b, bbox(a))
+    if len(ea) == 0 or len(eb) == 0:
+        return
+    a2, b2 = np.roll(a, -1, axis=0), np.roll(b, -1, axis=0)
+    for start in range(0, len(ea), CHUNK):
+        ia = ea[start:start + CHUNK][:, None]
+        ib = eb[None, :]
+        p, r = a[ia], a2[ia] - a[ia]
+        q, s = b[ib], b2[ib] - b[ib]
+        # 外接矩形が重ならない組は除く
+        near = ((np.minimum(a[ia], a2[ia]) <= np.maximum(q, b2[ib])).all(axis=2)
+                & (np.minimum(q, b2[ib]) <= np.maximum(a[ia], a2[ia])).all(axis=2))
+        ka, kb = np.nonzero(near)
+        if len(ka) == 0:
+            continue
+        p, r = p[ka, 0], r[ka, 0]
+        q, s = q[0, kb], s[0, kb]
+        ka, kb = ia[ka, 0], eb[kb]
+        qp = q - p
+        den = cross(r[:, 0], r[:, 1], s[:, 0], s[:, 1])
+        tn = cross(qp[:, 0], qp[:, 1], s[:, 0], s[:, 1])
+        un = cross(qp[:, 0], qp[:, 1], r[:, 0], r[:, 1])
+
+        # 交わる辺: 0 <= t, u <= 1（分母の符号に合わせて比べる）
+        sign = np.sign(den)
+        tn_s, un_s, den_s = tn * sign, un * sign, den * sign
+        hit = (den != 0) & (tn_s >= 0) & (tn_s <= den_s) & (un_s >= 0) & (un_s <= den_s)
+        for k in np.flatnonzero(hit):
+            t, u = tn[k] / den[k], un[k] / den[k]
+            # 端点で交わる場合は頂点の座標をそのまま使う（誤差のない点同士でつなぐため）
+            if tn[k] == 0:
+                point = tuple(p[k])
+            elif tn[k] == den[k]:
+                point = tuple(p[k] + r[k])
+            elif un[k] == 0:
+                point = tuple(q[k])
+            elif un[k] == den[k]:
+                point = tuple(q[k] + s[k])
+            else:
+                point = (float(p[k, 0] + t * r[k, 0]), float(p[k, 1] + t * r[k, 1]))
+            if 0 < t < 1:
+                splits[i][ka[k]].append((t, point))
+            if 0 < u < 1:
+                splits[j][kb[k]].append((u, point))
+
+        # 同じ直線上で重なる辺: 互いの端点で分割し、重なる区間を記録する
+        for k in np.flatnonzero((den == 0) & (un == 0)):
+            rr, ss = float(np.dot(r[k], r[k])), float(np.dot(s[k], s[k]))
+            if rr == 0 or ss == 0:
+                continue
+            t0, t1 = np.dot(q[k] - p[k], r[k]) / rr, np.dot(q[k] + s[k] - p[k], r[k]) / rr
+            lo, hi = max(0.0, min(t0, t1)), min(1.0, max(t0, t1))
+            if hi <= lo:
+                continue
+            u0, u1 = np.dot(p[k] - q[k], s[k]) / ss, np.dot(p[k] + r[k] - q[k], s[k]) / ss
+            same = float(np.dot(r[k], s[k])) > 0
+            for t, point in ((t0, q[k]), (t1, q[k] + s[k])):
+                if 0 < t < 1:
+                    splits[i][ka[k]].append((t, tuple(point)))
+            for u, point in ((u0, p[k]), (u1, p[k] + r[k])):
+                if 0 < u < 1:
+                    splits[j][kb[k]].append((u, tuple(point)))
+            shared[i].setdefault(ka[k], []).append((lo, hi, same, j))
+            shared[j].setdefault(kb[k], []).append((max(0.0, min(u0, u1)), min(1.0, max(u0, u1)), same, i))
+
+
+def inside(points, poly):
+    # 点が多角形の内部にあるか（交差数判定）。境界上の点は呼び出し側で除いておく
+    result = np.zeros(len(points), bool)
+    p, q = poly, np.roll(poly, -1, axis=0)
+    for start in range(0, len(points), CHUNK):
+        x = points[start:start + CHUNK, 0][:, None]
+        y = points[start:start + CHUNK, 1][:, None]
+        crosses = (p[:, 1] > y) != (q[:, 1] > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xs = p[:, 0] + (y - p[:, 1]) * (q[:, 0] - p[:, 0]) / (q[:, 1] - p[:, 1])
+        result[start:start + CHUNK] = (np.count_nonzero(crosses & (x < xs), axis=1) % 2) == 1
+    return result
+
+
+def boundary_edges(i, poly, splits, shared):
+    # 分割後の辺のうち和の境界になりうる辺を (始点 (K, 2), 終点 (K, 2), {辺の番号: 重なる相手の番号}) で返す
+    # 他の多角形と重なる辺は、同じ向きなら番号の小さい方だけ残し、逆向きなら両方捨てる
+    # 交点も重なりも無い辺（ほとんどの辺）はそのまま配列で扱う
+    n = len(poly)
+    special = sorted({e for e in range(n) if splits[e]} | set(shared))
+    plain = np.ones(n, bool)
+    plain[special] = False
+    starts, ends = [poly[plain]], [np.roll(poly, -1, axis=0)[plain]]
+    extra_a, extra_b, partners = [], [], {}
+    base = int(np.count_nonzero(plain))
+    for e in special:
+        cuts = sorted(splits[e])
+        chain = [tuple(poly[e])] + [point for _, point in cuts] + [tuple(poly[(e + 1) % n])]
+        ts = [0.0] + [t for t, _ in cuts] + [1.0]
+        for k in range(len(chain) - 1):
+            a, b = chain[k], chain[k + 1]
+            if a == b:
+                continue
+            tm = 0.5 * (ts[k] + ts[k + 1])
+            others = []
+            keep = True
+            for lo, hi, same, other in shared.get(e, ()):
+                if lo < tm < hi:
+                    others.append(other)
+                    if not same or other < i:
+                        keep = False
+            if keep:
+                if others:
+                    partners[base + len(extra_a)] = others
+                extra_a.append(a)
+                extra_b.append(b)
+    if extra_a:
+        starts.append(np.array(extra_a, np.float64))
+        ends.append(np.array(extra_b, np.float64))
+    return np.concatenate(starts), np.concatenate(ends), partners
+
+
+def union(polygons):
+    # 多角形（(N, 2) の頂点列）のリストの和を求め、外周の輪郭を面積の大きい順に返す
+    # 和の内側にできる穴は返さない
+    polys = [p for p in (prepare(poly) for poly in polygons) if p is not None]
+    boxes = [bbox(p) for p in polys]
+    splits = [[[] for _ in range(len(p))] for p in polys]
+    shared = [{} for _ in polys]
+    for i in range(len(polys)):
+        for j in range(i + 1, len(polys)):
+            if boxes_overlap(boxes[i], boxes[j]):
+                intersect(i, polys[i], j, polys[j], splits, shared)
+
+    # 他の多角形の内側にある辺を除く
+    edges = []
+    for i, poly in enumerate(polys):
+        starts, ends, partners = boundary_edges(i, poly, splits[i], shared[i])
+        mids = (starts + ends) * 0.5
+        drop = np.zeros(len(mids), bool)
+        for j, other in enumerate(polys):
+            if j == i:
+                continue
+            lo, hi = boxes[j]
+            near = np.flatnonzero(np.all((mids >= lo) & (mids <= hi), axis=1) & ~drop)
+            # 相手の境界上にある（重なっている）辺は内外判定の対象外
+            near = np.array([k for k in near if j not in partners.get(k, ())], dtype=np.intp)
+            if len(near):
+                drop[near[inside(mids[near], other)]] = True
+        keep = ~drop
+        edges += zip(map(tuple, starts[keep].tolist()), map(tuple, ends[keep].tolist()))
+    loops = [loop for loop in link(edges) if signed_area(loop) > 0]
+    loops.sort(key=signed_area, reverse=True)
+    return loops
+
+
+def link(edges):
+    # 辺を端点でつないで閉じた輪郭にする。1つの頂点から複数の辺が出る場合は最も右に曲がる辺を選ぶ
+    outgoing = {}
+    for k, (a, _) in enumerate(edges):
+        outgoing.setdefault(a, []).append(k)
+    used = [False] * len(edges)
+    loops = []
+    for first in range(len(edges)):
+        if used[first]:
+            continue
+        start = edges[first][0]
+        loop = []
+        k = first
+        while True:
+            used[k] = True
+            a, b = edges[k]
+            loop.append(a)
+            # 始点に戻っても、他の辺の方が外側なら先にそちらを回る（1点で接する部分を1本にする）
+            candidates = [c for c in outgoing.get(b, ()) if not used[c] or c == first]
+            if not candidates:
+                break  # 閉じない（誤差で端点が一致しない）辺は捨てる
+            if len(candidates) > 1:
+                k = rightmost(a, b, [edges[c][1] for c in candidates], candidates)
+            else:
+                k = candidates[0]
+            if k == first:
+                loops.append(np.array(loop, np.float64))
+                break
+    return [loop for loop in loops if len(loop) >= 3]
+
+
+def rightmost(a, b, ends, candidates):
+    # a→b と進んできて b から出る辺のうち、戻る向き b→a から反時計回りの角度が最も小さい辺
+    # （和の外側を右手に見て進むので、1点で接する2つの部分は1本の外周にまとまり、穴には入らない）
+    bx, by = b[0] - a[0], b[1] - a[1]
+    best, best_angle = candidates[0], 3 * math.pi
+    for c, (ex, ey) in zip(candidates, ends):
+        dx, dy = ex - b[0], ey - b[1]
+        angle = math.atan2(cross(-bx, -by, dx, dy), -bx * dx - by * dy) % (2 * math.pi)
+        if angle == 0:
+            # 来た道を戻る辺（斜め1画素でつながる所の往復）は最後に選ぶ
+            angle = 2 * math.pi
+        if angle < best_angle:
+            best, best_angle = c, angle
+    return best
+
+
+def densify(loop, step=1.0):
+    # 閉じた輪郭の辺を step 画素以下の間隔の整数座標の点列 (N, 2) int32 にする
+    # （cv2.findContours の CHAIN_APPROX_NONE と同じくらいの点の密度にして、後段のスムージングに渡す）
+    p = np.asarray(loop, np.float64)
+    d = np.roll(p, -1, axis=0) - p
+    counts = np.maximum(1, np.ceil(np.hypot(d[:, 0], d[:, 1]) / step)).astype(np.intp)
+    idx = np.repeat(np.arange(len(p)), counts)
+    frac = (np.arange(len(idx)) - np.repeat(np.cumsum(counts) - counts, counts)) / np.repeat(counts, counts)
+    pts = np.rint(p[idx] + d[idx] * frac[:, None]).astype(np.int32)
+    keep = np.any(pts != np.roll(pts, 1, axis=0), axis=1)
+    return pts[keep] if keep.any() else pts[:1]
@@ -0,0 +1,234 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ステージごとの計測（経過時間・CPU時間・メモリのピーク）
+# with Profiler("job") as prof: の中で呼ばれた @profiled の関数と、その中の step() の区切りを記録し、
+# Chrome のトレース形式（chrome://tracing / Perfetto で開ける JSON）で書き出す
+# 区間の入れ子はスレッドごとに持つので、propagate() で包んだ関数をスレッドプールで実行しても記録できる
+
+_local = threading.local()
+
+
+class _Span:
+    def __init__(self, name, is_step=False, args=None):
+        self.name = name
+        self.is_step = is_step
+        self.args = dict(args or {})
+        self.start = time.perf_counter()
+        # cpu_ms は区間を開いたスレッドのCPU時間（台座・キャラクターごとの区間は並列に走るので、
+        # プロセス全体のCPU時間では他のスレッドの分まで数えてしまう）。タイルのスレッドも含めた値は process_cpu_ms
+        self.cpu_start = time.thread_time()
+        self.process_cpu_start = time.process_time()
+        self.mem_start = 0
+        self.mem_peak = 0
+
+
+class Profiler:
+    # track_memory: tracemalloc で Python / NumPy のメモリ確保を追跡する（計測中は少し遅くなる）
+    def __init__(self, name="job", track_memory=True):
+        self.name = name
+        self.track_memory = track_memory
+        self.events = []
+        self._stacks = {}  # スレッドID -> 開いている区間のリスト
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+        self._started_tracemalloc = False
+
+    def __enter__(self):
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        _local.profiler = self
+        return self
+
+    @property
+    def _stack(self):
+        # 呼び出したスレッドで開いている区間
+        with self._lock:
+            return self._stacks.setdefault(threading.get_ident(), [])
+
+    def __exit__(self, *exc):
+        while self._stack:
+            self._close()
+        _local.profiler = None
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        return False
+
+    def _fold_peak(self):
+        # 開いている区間すべてにここまでのピークを反映してからピークをリセットする
+        # （区間が入れ子になっていても、それぞれの区間内の最大値が残る）
+        # tracemalloc のピークはプロセス全体の値なので、他のスレッドで開いている区間にも反映する
+        if not tracemalloc.is_tracing():
+            return 0
+        with self._lock:
+            current, peak = tracemalloc.get_traced_memory()
+            for stack in self._stacks.values():
+                for span in stack:
+                    span.mem_peak = max(span.mem_peak, peak)
+            tracemalloc.reset_peak()
+        return current
+
+    def _open(self, name, is_step=False, args=None):
+        current = self._fold_peak()
+        span = _Span(name, is_step, args)
+        span.mem_start = span.mem_peak = current
+        self._stack.append(span)
+        return span
+
+    def _close(self):
+        self._fold_peak()
+        span = self._stack.pop()
+        end = time.perf_counter()
+        args = dict(span.args)
+        args["cpu_ms"] = round((time.thread_time() - span.cpu_start) * 1000, 3)
+        args["process_cpu_ms"] = round((time.process_time() - span.process_cpu_start) * 1000, 3)
+        if tracemalloc.is_tracing():
+            args["peak_alloc_mb"] = round((span.mem_peak - span.mem_start) / 2**20, 3)
+        if resource is not None and not span.is_step:
+            args["max_rss_mb"] = round(_max_rss_bytes() / 2**20, 1)
+        self.events.append({
+            "name": span.name,
+            "cat": "step" if span.is_step else "stage",
+            "ph": "X",
+            "ts": round((span.start - self._origin) * 1e6, 1),
+            "dur": round((end - span.start) * 1e6, 1),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+
+    def span(self, name, **args):
+        return _SpanContext(self, name, args)
+
+    def step(self, name):
+        # 現在の区間の中で次の処理段階に進む（前の段階は閉じる）
+        if self._stack and self._stack[-1].is_step:
+            self._close()
+        if self._stack:
+            self._open(name, is_step=True)
+
+    def annotate(self, **args):
+        # 一番内側のステージ（段階ではない区間）に情報を付ける
+        for span in reversed(self._stack):
+            if not span.is_step:
+                span.args.update(args)
+                return
+
+    def stages(self):
+        # ステージ単位の記録を開始順に返す
+        return sorted((e for e in self.events if e["cat"] == "stage"), key=lambda e: e["ts"])
+
+    def summary(self):
+        lines = [f"{'stage':<24} {'wall[ms]':>10} {'cpu[ms]':>10} {'peak[MB]':>10}"]
+        for e in self.stages():
+            peak = e["args"].get("peak_alloc_mb", "-")
+            lines.append(f"{e['name']:<24} {e['dur'] / 1000:>10.1f} {e['args']['cpu_ms']:>10.1f} {peak:>10}")
+        return "\n".join(lines)
+
+    def trace(self):
+        meta = [{
+            "name": "process_name", "ph": "M", "pid": os.getpid(), "tid": 0,
+            "args": {"name": self.name},
+        }]
+        return {"traceEvents": meta + sorted(self.events, key=lambda e: e["ts"]),
+                "displayTimeUnit": "ms"}
+
+    def write_trace(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f, ensure_ascii=False, indent=1, default=_json_value)
+        return path
+
+
+def _json_value(value):
+    # annotate() に渡された numpy のスカラー・配列はPythonの値にして書く（それ以外は文字列にする）
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return str(value)
+
+
+class _SpanContext:
+    def __init__(self, profiler, name, args):
+        self.profiler = profiler
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.span = self.profiler._open(self.name, args=self.args)
+        return self.span
+
+    def __exit__(self, *exc):
+        # 途中で例外が出ても、この区間の中で開いた段階ごと閉じる
+        stack = self.profiler._stack
+        while stack and stack[-1] is not self.span:
+            self.profiler._close()
+        if stack:
+            self.profiler._close()
+        return False
+
+
+def _max_rss_bytes():
+    # プロセス開始からの最大RSS（Linux は KB 単位、macOS はバイト単位）
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+
+def active():
+    # このスレッドで計測中の Profiler（無ければ None）
+    return getattr(_local, "profiler", None)
+
+
+def propagate(fn):
+    # 呼び出し元のスレッドで計測中なら、別のスレッドで fn を実行しても同じ Profiler に記録されるように包む
+    # （ThreadPoolExecutor に渡す関数用。計測中でなければ fn をそのまま返す）
+    prof = active()
+    if prof is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = active()
+        _local.profiler = prof
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.profiler = previous
+    return wrapper
+
+
+def profiled(name=None):
+    # 計測中なら関数全体を1つのステージとして記録するデコレータ
+    def decorate(fn):
+        label = name or fn.__name__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            prof = active()
+            if prof is None:
+                return fn(*args, **kwargs)
+            with prof.span(label):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def step(name):
+    prof = active()
+    if prof is not None:
+        prof.step(name)
+
+
+def annotate(**args):
+    prof = active()
+    if prof is not None:
+        prof.annotate(**args)
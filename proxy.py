@@ -0,0 +1,67 @@
+import math
+
+from PIL import Image
+
+import memory
+from document import CutDocument
+from offset import to_px
+
+# 低解像度プレビュー（プロキシ）
+# 台座サイズを試している間は縮小した画像で全ステージを実行して表示し、
+# 本番解像度のカット線は出力（または確定）のときにだけ計算する
+
+# プロキシ画像の最大画素数
+MAX_PIXELS = 1_000_000
+# メモリの上限で縮小するときの下限の画素数
+MIN_PIXELS = 100_000
+# 全ステージを実行するときの1画素あたりのおおよそのバイト数
+# （絵柄4・マスクとリング2・距離変換4・補助線とカット線2・表示用の合成画像8 に余裕を足したもの）
+STAGE_BYTES_PER_PIXEL = 24
+# 縮小しても輪郭リングが消えないようにするリングの最小の太さ [px]
+MIN_RING = 1.5
+
+
+def budget_pixels():
+    # プロキシの最大画素数。メモリの上限があるときは、全ステージが空きに収まるまで小さくする
+    room = memory.free()
+    if room is None:
+        return MAX_PIXELS
+    return max(MIN_PIXELS, min(MAX_PIXELS, room // STAGE_BYTES_PER_PIXEL))
+
+
+def fits_full_resolution(size):
+    # 画像 (幅, 高さ) の本番解像度で全ステージを実行してもメモリの上限に収まるか
+    w, h = size
+    return memory.fits(w * h * STAGE_BYTES_PER_PIXEL)
+
+
+def proxy_scale(size, max_pixels=None):
+    # 画像 (幅, 高さ) を max_pixels（省略時は budget_pixels()）以下にする縮小率（縮小不要なら 1.0）
+    max_pixels = max_pixels or budget_pixels()
+    w, h = size
+    return min(1.0, math.sqrt(max_pixels / float(w * h)))
+
+
+def make_proxy(doc, max_pixels=None):
+    # 戻り値: (縮小した CutDocument, 縮小率)。十分小さい画像は (doc, 1.0) をそのまま返す
+    w, h = doc.canvas_size
+    scale = proxy_scale((w, h), max_pixels)
+    if scale >= 1.0:
+        return doc, 1.0
+    size = (max(1, round(w * scale)), max(1, round(h * scale)))
+    # RGBA の縮小は PIL がアルファ乗算してから行うので、透明部分の色がにじまない
+    small = Image.fromarray(doc.artwork).resize(size, Image.Resampling.BOX)
+    return CutDocument(small), scale
+
+
+def scale_pedestal(pedestal, base_size, scale):
+    # 台座画像とサイズをプロキシの縮小率に合わせる（台座画像が無い場合は None のまま）
+    size = (max(1, round(base_size[0] * scale)), max(1, round(base_size[1] * scale)))
+    if pedestal is None:
+        return None, size
+    return pedestal.resize(size, Image.Resampling.LANCZOS), size
+
+
+def scale_offsets(gap, thickness, scale):
+    # 輪郭リングの隙間と太さ [px] をプロキシ用に縮小する（細くなりすぎる場合は MIN_RING にする）
+    return to_px(gap) * scale, max(MIN_RING, to_px(thickness) * scale)
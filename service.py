@@ -0,0 +1,386 @@
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import signal
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+from PIL import Image
+
+import batch
+import memory
+import pedestal
+import pipeline
+from document import CutDocument
+from offset import to_px
+from writers import write_png_base64
+
+# ローカルHTTPのジョブサービス（Webストアから受けた注文の画像を処理する）
+# 受け付けたジョブは上限付きの待ち行列に入れ、起動時に作った固定数のワーカープロセスが順に処理する
+# ワーカーは import・台座画像の読み込み・OpenCV の初期化を済ませてから待つので、1件目から速く処理できる
+# 例: python app.py serve --port 8080 --workers 4 --queue 32
+#     curl --data-binary @art.png "http://127.0.0.1:8080/jobs?base=14mm"   → {"id": "...", "status": "queued", ...}
+#     curl http://127.0.0.1:8080/jobs/ID                                     → ジョブの状態
+#     curl -o out.svg "http://127.0.0.1:8080/jobs/ID/result?wait=30"         → 終わるまで最大30秒待ってSVGを受け取る
+#     curl -X DELETE http://127.0.0.1:8080/jobs/ID                           → 結果を削除
+#     curl http://127.0.0.1:8080/health                                      → ワーカー数・待ち行列の状態
+
+# 処理待ちにできるジョブの数。超えた注文は 503（Retry-After 付き）で断り、後で送り直してもらう
+QUEUE_SIZE = 32
+# 受け付ける画像の最大サイズ [MB]
+MAX_UPLOAD_MB = 50
+# 終わったジョブの結果を残しておく時間 [秒]
+KEEP_SECONDS = 3600
+# 待ち行列が一杯のときに、次に送ってよいまでの目安 [秒]
+RETRY_AFTER = 5
+# result?wait= で待てる最大の時間 [秒]
+MAX_WAIT = 60
+
+CONTENT_TYPES = {".svg": "image/svg+xml", ".dxf": "application/dxf", ".pdf": "application/pdf"}
+# 受け付ける画像の形式（PIL の形式名 → 保存する拡張子）
+UPLOAD_FORMATS = {"PNG": ".png", "JPEG": ".jpg", "BMP": ".bmp"}
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+def _init_worker(assets_dir, cache_dir=None, cache_bytes=None, threads=1, max_rss=None):
+    # バッチ処理と同じワーカーの初期化に加えて、台座画像を全サイズ用意し、小さい画像で一通り処理しておく
+    batch._init_worker(assets_dir, cache_dir, cache_bytes, None, threads, max_rss)
+    batch._pedestals.preload()
+    _warm_up()
+
+
+def _warm_up():
+    # 輪郭線作成 → 台座合成 → カット線 → PNGエンコード を小さい画像で実行し、遅延初期化を済ませる
+    art = np.zeros((240, 160, 4), np.uint8)
+    cv2.ellipse(art, (80, 140), (50, 80), 0, 0, 360, (40, 90, 180, 255), -1)
+    doc = pipeline.create_outline(CutDocument(Image.fromarray(art, "RGBA")))
+    base = batch._pedestals.keys()[0]
+    doc = pipeline.combine_base(doc, batch._pedestals.get(base), batch._pedestals.size(base))
+    pipeline.cut_path(doc)
+    image, _ = pipeline.print_image(doc)
+    write_png_base64(io.StringIO(), image)
+
+
+class Job:
+    def __init__(self, job_id, in_path, out_path, base):
+        self.id = job_id
+        self.in_path = in_path
+        self.out_path = out_path
+        self.base = base
+        self.status = "queued"  # queued → running → done / failed
+        self.error = ""
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.done = threading.Event()
+
+    def info(self, position=None):
+        info = {"id": self.id, "status": self.status, "base": self.base,
+                "format": os.path.splitext(self.out_path)[1][1:]}
+        if position is not None:
+            info["position"] = position
+        if self.started is not None:
+            info["waited"] = round(self.started - self.submitted, 3)
+        if self.finished is not None:
+            info["elapsed"] = round(self.finished - self.started, 3)
+        if self.error:
+            info["error"] = self.error
+        return info
+
+
+class JobService:
+    # 待ち行列とワーカープロセスの管理
+    # ワーカー1つにつき1本の振り分けスレッドが待ち行列からジョブを取り出し、ワーカーの処理が終わるまで待つ
+    # （同時に処理するのはワーカー数まで。待ち行列は queue_size まで）
+    def __init__(self, jobs_dir, workers, queue_size=QUEUE_SIZE, keep_seconds=KEEP_SECONDS,
+                 cache_dir=None, cache_bytes=None, max_rss=None):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.keep_seconds = keep_seconds
+        self.queue = queue.Queue(queue_size)
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.bases = set(pedestal.BASE_SIZES) | set(pedestal.discover(pipeline.get_assets_dir()))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        self.pool = multiprocessing.Pool(workers, initializer=_init_worker,
+                                         initargs=(pipeline.get_assets_dir(), cache_dir, cache_bytes, threads, max_rss))
+        self.dispatchers = [threading.Thread(target=self._dispatch, name=f"dispatch-{i}", daemon=True)
+                            for i in range(workers)]
+        for thread in self.dispatchers:
+            thread.start()
+
+    def full(self):
+        return self.queue.full()
+
+    def submit(self, data, base, fmt="svg", gap=pipeline.OUTLINE_GAP, thickness=pipeline.OUTLINE_THICKNESS,
+               tolerance=pipeline.CUT_TOLERANCE, print_layer=True):
+        # 画像のバイト列を保存して待ち行列に入れる。一杯なら ServiceBusy、画像や設定が不正なら ValueError
+        if base not in self.bases:
+            raise ValueError(f"unknown base: {base} (choose from {', '.join(pedestal.sort_keys(self.bases))})")
+        if "." + fmt not in pipeline.EXPORT_FORMATS:
+            raise ValueError(f"unknown format: {fmt}")
+        for value in (gap, thickness, tolerance):
+            to_px(value)
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                ext = UPLOAD_FORMATS.get(img.format)
+                img.verify()
+        except Exception as e:
+            raise ValueError(f"not a readable image: {e}")
+        if ext is None:
+            raise ValueError(f"unsupported image format (use {', '.join(UPLOAD_FORMATS)})")
+        self.purge()
+
+        job_id = uuid.uuid4().hex
+        job = Job(job_id, os.path.join(self.jobs_dir, job_id + ext), os.path.join(self.jobs_dir, f"{job_id}.{fmt}"), base)
+        with open(job.in_path, "wb") as f:
+            f.write(data)
+        task = (job.in_path, {base: job.out_path}, gap, thickness, tolerance, print_layer, None)
+        with self.lock:
+            try:
+                self.queue.put_nowait((job, task))
+            except queue.Full:
+                os.remove(job.in_path)
+                raise ServiceBusy()
+            self.jobs[job_id] = job
+        return job
+
+    def _dispatch(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            job, task = item
+            with self.lock:
+                job.status = "running"
+                job.started = time.time()
+            try:
+                _, _, ok, _, detail = self.pool.apply(batch._process_one, (task,))
+            except Exception as e:
+                ok, detail = False, f"{type(e).__name__}: {e}"
+            with self.lock:
+                job.finished = time.time()
+                job.status = "done" if ok else "failed"
+                if not ok:
+                    # 応答には例外の1行目だけを返し、トレースバックはサーバーのログに出す
+                    job.error = detail.splitlines()[0] if detail else "failed"
+                    print(f"[NG] {job.id}: {detail}")
+            job.done.set()
+            if os.path.exists(job.in_path):
+                os.remove(job.in_path)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def info(self, job):
+        with self.lock:
+            position = None
+            if job.status == "queued":
+                with self.queue.mutex:
+                    position = next((i for i, item in enumerate(self.queue.queue) if item and item[0] is job), None)
+            return job.info(position)
+
+    def remove(self, job_id):
+        # 終わったジョブの結果を削除する。処理待ち・処理中のジョブは削除できない（False）
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.finished is None:
+                return False
+            del self.jobs[job_id]
+        for path in (job.in_path, job.out_path):
+            if os.path.exists(path):
+                os.remove(path)
+        return True
+
+    def purge(self):
+        # 終わってから keep_seconds 以上たったジョブを削除する
+        now = time.time()
+        with self.lock:
+            old = [j.id for j in self.jobs.values() if j.finished is not None and now - j.finished > self.keep_seconds]
+        for job_id in old:
+            self.remove(job_id)
+
+    def stats(self):
+        with self.lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "queue_size": self.queue.maxsize, "queued": self.queue.qsize(),
+                "jobs": counts}
+
+    def close(self):
+        for _ in self.dispatchers:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                break
+        self.pool.terminate()
+        self.pool.join()
+
+
+class Handler(BaseHTTPRequestHandler):
+    # POST /jobs?base=16mm&format=svg  本文に画像のバイト列 → 202 と受付番号（待ち行列が一杯なら 503）
+    # GET /jobs/ID                    → ジョブの状態
+    # GET /jobs/ID/result?wait=秒      → 出力ファイル（終わっていなければ 202 と状態、失敗なら 500）
+    # DELETE /jobs/ID                 → 結果の削除
+    # GET /health                     → ワーカー数と待ち行列の状態
+    server_version = "cutline-service"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/jobs":
+            return self._json(404, {"error": "not found"})
+        size = int(self.headers.get("Content-Length") or 0)
+        # 本文を読む前に断れるものは断る（一杯のときにアップロードを受け取らない）
+        if self.service.full():
+            return self._busy()
+        if size <= 0:
+            return self._json(400, {"error": "send the image as the request body"}, close=True)
+        if size > self.server.max_upload:
+            return self._json(413, {"error": f"image is larger than {self.server.max_upload // 2**20}MB"}, close=True)
+        data = self.rfile.read(size)
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            job = self.service.submit(
+                data, query.get("base", "16mm"), query.get("format", "svg"),
+                gap=query.get("gap", pipeline.OUTLINE_GAP), thickness=query.get("thickness", pipeline.OUTLINE_THICKNESS),
+                tolerance=query.get("tolerance", pipeline.CUT_TOLERANCE),
+                print_layer=query.get("print_layer", "1") not in ("0", "false", "no"))
+        except ServiceBusy:
+            return self._busy()
+        except ValueError as e:
+            return self._json(400, {"error": str(e)})
+        self._json(202, self.service.info(job), {"Location": f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._json(200, self.service.stats())
+        m = re.fullmatch(r"/jobs/([0-9a-f]+)(/result)?", url.path)
+        job = self.service.get(m.group(1)) if m else None
+        if job is None:
+            return self._json(404, {"error": "no such job"})
+        if not m.group(2):
+            return self._json(200, self.service.info(job))
+
+        wait = parse_qs(url.query).get("wait", ["0"])[-1]
+        try:
+            job.done.wait(min(MAX_WAIT, max(0.0, float(wait))))
+        except ValueError:
+            return self._json(400, {"error": f"bad wait: {wait}"})
+        if job.status == "failed":
+            return self._json(500, self.service.info(job))
+        if job.status != "done":
+            return self._json(202, self.service.info(job), {"Retry-After": str(RETRY_AFTER)})
+        try:
+            f = open(job.out_path, "rb")
+        except FileNotFoundError:
+            return self._json(404, {"error": "result was removed"})
+        with f:
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES.get(os.path.splitext(job.out_path)[1], "application/octet-stream"))
+            self.send_header("Content-Length", str(os.fstat(f.fileno()).st_size))
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile)
+
+    def do_DELETE(self):
+        m = re.fullmatch(r"/jobs/([0-9a-f]+)", urlparse(self.path).path)
+        job = self.service.get(m.group(1)) if m else None
+        if job is None:
+            return self._json(404, {"error": "no such job"})
+        if not self.service.remove(job.id):
+            return self._json(409, {"error": "job is not finished"})
+        self._json(200, {"id": job.id, "status": "deleted"})
+
+    def _busy(self):
+        self._json(503, {"error": "queue is full, retry later", **self.service.stats()},
+                   {"Retry-After": str(RETRY_AFTER)}, close=True)
+
+    def _json(self, code, body, headers=None, close=False):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if close:
+            # 本文を読まずに返す場合は接続を閉じる
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="app.py serve",
+        description="画像と台座サイズを受け付けてSVGを返すローカルHTTPのジョブサービス"
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けるアドレス（既定: このマシンからのみ）")
+    parser.add_argument("--port", type=int, default=8080, help="待ち受けるポート")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="ワーカープロセス数（同時に処理するジョブの数）")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE, help="処理待ちにできるジョブの数（超えたら 503 で断る）")
+    parser.add_argument("--max-upload-mb", type=int, default=MAX_UPLOAD_MB, help="受け付ける画像の最大サイズ[MB]")
+    parser.add_argument("--keep-minutes", type=int, default=KEEP_SECONDS // 60, help="終わったジョブの結果を残しておく時間[分]")
+    parser.add_argument("--jobs-dir", default=None, help="受け付けた画像と結果の保存先（既定: 一時フォルダ、終了時に削除）")
+    parser.add_argument("--cache-dir", default=None, help="結果キャッシュの保存先（既定: ~/.cutline/cache）")
+    parser.add_argument("--cache-size-mb", type=int, default=512, help="結果キャッシュの上限サイズ[MB]")
+    parser.add_argument("--no-cache", action="store_true", help="結果キャッシュを使わない")
+    parser.add_argument("--max-rss-mb", type=int, default=0,
+                        help="ワーカー1つあたりのメモリ上限[MB]（0なら制限しない）")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.max_rss_mb and not memory.supported():
+        parser.error("この環境ではメモリ使用量（RSS）を測れないので、--max-rss-mb は使えません")
+    # ポートが使えないときはワーカーを起動する前に止める
+    server = ThreadingHTTPServer((args.host, args.port), Handler)
+    server.daemon_threads = True
+    server.max_upload = args.max_upload_mb * 2**20
+    jobs_dir = args.jobs_dir or tempfile.mkdtemp(prefix="cutline-jobs-")
+    os.makedirs(jobs_dir, exist_ok=True)
+    workers = max(1, args.workers)
+    print(f"Starting {workers} workers (queue {args.queue}) ...")
+    server.service = JobService(jobs_dir, workers, max(1, args.queue), args.keep_minutes * 60,
+                                cache_dir=args.cache_dir, cache_bytes=0 if args.no_cache else args.cache_size_mb * 2**20,
+                                max_rss=args.max_rss_mb * 2**20)
+    print(f"Listening on http://{args.host}:{server.server_address[1]} (jobs in {jobs_dir})")
+    # サービスとして止められたとき（SIGTERM）も Ctrl+C と同じようにワーカーと一時フォルダを片付ける
+    signal.signal(signal.SIGTERM, _stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.close()
+        if not args.jobs_dir:
+            shutil.rmtree(jobs_dir, ignore_errors=True)
+    return 0
@@ -0,0 +1,111 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import memory
+
+# 大きな画像を横長の帯（タイル）に分けてスレッドで並列処理する
+# OpenCV の関数は処理中に GIL を解放するので、スレッドでも複数コアを使える
+# 近傍を参照する処理（膨張・距離変換）は halo 行ぶん上下に重ねて切り出し、内側だけを書き戻すので
+# 結果はタイルに分けない場合と同じになる
+# メモリの上限（memory.set_limit）があるときは、タイルの一時配列が空きに収まるまで帯を細くし、
+# 1スレッドでも帯ごとに順に処理する
+
+# これより画素数が少ない画像は分割しない（スレッドの切り替えの方が高くつく）
+MIN_PIXELS = 4_000_000
+# 1タイルの最小の行数
+MIN_ROWS = 256
+
+_workers = os.cpu_count() or 1
+_pool = None
+_lock = threading.Lock()
+
+
+def set_workers(n):
+    # 並列数を変える（バッチ処理ではプロセス単位で並列化するので 1 にする）
+    global _workers, _pool
+    with _lock:
+        _workers = max(1, int(n))
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def workers():
+    return _workers
+
+
+def _executor():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(_workers, thread_name_prefix="tile")
+        return _pool
+
+
+def bands(height, width, halo=0, cost=0):
+    # (切り出し開始, 切り出し終了, 書き戻し開始, 書き戻し終了) の行番号のリスト
+    # cost: fn がタイルの1画素あたりに使う一時配列のバイト数（メモリの上限があるときの帯の太さに使う）
+    limit_rows = memory.max_rows(width, cost, _workers, minimum=2 * halo + 1) if cost else None
+    if limit_rows is not None and limit_rows + 2 * halo >= height:
+        limit_rows = None
+    if limit_rows is None and (_workers <= 1 or height * width < MIN_PIXELS):
+        return [(0, height, 0, height)]
+    rows = max(MIN_ROWS, -(-height // (_workers * 2))) if _workers > 1 else height
+    if limit_rows is not None:
+        # 上下の halo も一時配列に含まれるので、その分だけ書き戻す行を減らす
+        rows = min(rows, limit_rows - 2 * halo)
+    out = []
+    for y0 in range(0, height, rows):
+        y1 = min(height, y0 + rows)
+        out.append((max(0, y0 - halo), min(height, y1 + halo), y0, y1))
+    return out
+
+
+def map_rows(fn, src, halo=0, dtype=np.uint8, cost=0, out=None):
+    # fn(src の切り出し) の内側の行を集めた (H, W) の配列を返す。タイルごとに並列実行する
+    # fn は入力と同じ行数・列数の2次元配列を返す関数
+    # out: 結果を書き込む (H, W) の配列（省略時は新しく確保する）
+    h, w = src.shape[:2]
+    parts = bands(h, w, halo, cost)
+    if len(parts) == 1:
+        if out is None:
+            return fn(src)
+        out[...] = fn(src)
+        return out
+    if out is None:
+        out = np.empty((h, w), dtype=dtype)
+
+    def run(part):
+        t0, t1, y0, y1 = part
+        out[y0:y1] = fn(src[t0:t1])[y0 - t0:y1 - t0]
+
+    _each(run, parts)
+    return out
+
+
+def apply_rows(fn, src, out):
+    # 画素ごとの処理 fn(src の帯, out の同じ帯) をタイルごとに実行し、結果を out に直接書き込む
+    # （近傍を参照しない処理用。タイルごとの一時配列を作らない）
+    h, w = src.shape[:2]
+    _each(lambda p: fn(src[p[2]:p[3]], out[p[2]:p[3]]), bands(h, w))
+    return out
+
+
+def reduce_rows(fn, src):
+    # タイルごとの fn(src[y0:y1]) の結果をリストで返す（集計は呼び出し側で行う）
+    h, w = src.shape[:2]
+    parts = bands(h, w)
+    if len(parts) == 1:
+        return [fn(src)]
+    return _each(lambda p: fn(src[p[2]:p[3]]), parts)
+
+
+def _each(run, parts):
+    # 1スレッドのとき（メモリの上限で帯に分けた場合）は呼び出し元のスレッドで順に実行する
+    if _workers <= 1:
+        return [run(p) for p in parts]
+    # list() で全タイルの完了を待ち、例外があればここで送出させる
+    return list(_executor().map(run, parts))
@@ -0,0 +1,134 @@
+import queue
+import threading
+import traceback
+
+# 処理ステージをTkのメインループとは別のスレッドで順番に実行する
+# 進捗・結果・エラーはキュー経由でUIスレッドに渡し、root.after のポーリングでコールバックを呼ぶ
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, name, fn, on_done=None, on_error=None, on_cancelled=None):
+        self.name = name
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_cancelled = on_cancelled
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+
+class JobContext:
+    # パイプラインの progress 引数に渡すコールバック
+    # 呼ばれるたびに中止要求を確認し、進捗をUIスレッドへ送る
+    def __init__(self, job, post):
+        self.job = job
+        self._post = post
+
+    def check_cancelled(self):
+        if self.job.cancelled:
+            raise JobCancelled(self.job.name)
+
+    def __call__(self, fraction, message=""):
+        self.check_cancelled()
+        self._post(("progress", self.job, fraction, message))
+
+
+class StageWorker:
+    def __init__(self, root, on_progress=None, on_idle=None, poll_ms=50):
+        self.root = root
+        self.on_progress = on_progress  # (job, 割合, メッセージ) UIスレッドで呼ばれる
+        self.on_idle = on_idle  # 待ち行列が空になったとき UIスレッドで呼ばれる
+        self.poll_ms = poll_ms
+        self.current = None
+        self._jobs = queue.Queue()
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        self._queued = []
+        self._thread = threading.Thread(target=self._run, name="StageWorker", daemon=True)
+        self._thread.start()
+        self.root.after(self.poll_ms, self._poll)
+
+    @property
+    def busy(self):
+        with self._lock:
+            return self.current is not None or bool(self._queued)
+
+    def pending(self):
+        # 実行中＋待ち行列のジョブ数
+        with self._lock:
+            return len(self._queued) + (1 if self.current is not None else 0)
+
+    def submit(self, name, fn, on_done=None, on_error=None, on_cancelled=None):
+        # fn(ctx) はワーカースレッドで実行される。Tkウィジェットには触らないこと
+        job = Job(name, fn, on_done, on_error, on_cancelled)
+        with self._lock:
+            self._queued.append(job)
+        self._jobs.put(job)
+        return job
+
+    def cancel_all(self):
+        # 実行中のジョブと待ち行列のジョブをすべて中止する
+        with self._lock:
+            jobs = list(self._queued)
+            if self.current is not None:
+                jobs.append(self.current)
+        for job in jobs:
+            job.cancel()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            with self._lock:
+                self._queued.remove(job)
+                self.current = job
+            try:
+                if job.cancelled:
+                    raise JobCancelled(job.name)
+                ctx = JobContext(job, self._events.put)
+                ctx(0.0, "")
+                result = job.fn(ctx)
+                self._events.put(("done", job, result, None))
+            except JobCancelled:
+                self._events.put(("cancelled", job, None, None))
+            except Exception as e:
+                self._events.put(("error", job, e, traceback.format_exc()))
+            finally:
+                with self._lock:
+                    self.current = None
+                self._events.put(("finished", job, None, None))
+
+    def _poll(self):
+        try:
+            while True:
+                kind, job, value, detail = self._events.get_nowait()
+                if kind == "progress":
+                    if self.on_progress and not job.cancelled:
+                        self.on_progress(job, value, detail)
+                elif kind == "done":
+                    if job.on_done:
+                        job.on_done(value)
+                elif kind == "error":
+                    if job.on_error:
+                        job.on_error(value, detail)
+                    else:
+                        print(f"Error in {job.name}:", value)
+                        print(detail)
+                elif kind == "cancelled":
+                    if job.on_cancelled:
+                        job.on_cancelled()
+                elif kind == "finished":
+                    if self.on_idle and not self.busy:
+                        self.on_idle()
+        except queue.Empty:
+            pass
+        self.root.after(self.poll_ms, self._poll)
@@ -0,0 +1,193 @@
+import base64
+import zlib
+
+import numpy as np
+
+from pedestal import PX_PER_MM
+
+# 出力ファイルの書き出し補助
+# 埋め込み画像はメモリ上でPNGエンコードし、base64に変換しながら少しずつ書き込む
+# DXF・PDF はカット線の座標（と印刷画像の画素）から直接、少しずつ書き込む（SVG・PNGを経由しない）
+
+# DXF のカット線の画層の名前と色（AutoCAD の色番号 1 = 赤）
+DXF_CUT_LAYER = "CUT"
+DXF_CUT_COLOR = 1
+# PDF のレイヤー（オプショナルコンテンツ）の名前。面付けしたSVGのグループと同じ
+PDF_PRINT_LAYER = "print"
+PDF_CUT_LAYER = "cut"
+# PDF のカット線の特色名。カッティングプロッタのRIPはこの名前の特色をカットパスとして扱う
+PDF_CUT_SPOT = "CutContour"
+# PDF のカット線の太さ [px]（SVG と同じ）
+PDF_CUT_WIDTH = 0.5
+# PDF に埋め込む画像を1回に圧縮する行数
+PDF_BAND_ROWS = 256
+
+
+class Base64Writer:
+    # PIL の save() に渡せる書き込み専用ストリーム
+    # 受け取ったバイト列を3バイト単位でbase64に変換し、テキストファイル out に書き込む
+    def __init__(self, out, chunk_size=3 * 16384):
+        self.out = out
+        self.chunk_size = chunk_size - chunk_size % 3
+        self._pending = bytearray()
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending += data
+        if len(self._pending) >= self.chunk_size:
+            n = len(self._pending) - len(self._pending) % 3
+            self.out.write(base64.b64encode(self._pending[:n]).decode("ascii"))
+            del self._pending[:n]
+        return len(data)
+
+    def flush(self):
+        # 3バイトに満たない端数は close() までは書かない（パディングが入るため）
+        pass
+
+    def close(self):
+        if not self.closed:
+            if self._pending:
+                self.out.write(base64.b64encode(self._pending).decode("ascii"))
+                self._pending.clear()
+            self.closed = True
+
+
+def write_png_base64(out, image):
+    # image をPNGとしてエンコードし、base64文字列として out に書き込む
+    stream = Base64Writer(out)
+    image.save(stream, format="PNG")
+    stream.close()
+
+
+def write_dxf(out, polylines, height, px_per_mm=PX_PER_MM[0], layer=DXF_CUT_LAYER):
+    # 閉じた折れ線 [(N, 2) px] を mm 単位の DXF（R12 の POLYLINE）としてテキストファイル out に書き込む
+    # DXF は上向きが y の正なので、キャンバスの高さ height [px] で上下を反転する
+    # R12 には単位を指定するヘッダー（$INSUNITS）が無いので、読み込む側で単位を mm にする
+    out.write("0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n0\nENDSEC\n")
+    out.write(f"0\nSECTION\n2\nTABLES\n0\nTABLE\n2\nLAYER\n70\n1\n"
+              f"0\nLAYER\n2\n{layer}\n70\n0\n62\n{DXF_CUT_COLOR}\n6\nCONTINUOUS\n0\nENDTAB\n0\nENDSEC\n")
+    out.write("0\nSECTION\n2\nENTITIES\n")
+    for pts in polylines:
+        # 66: 頂点が続く、70: 1 = 閉じた折れ線
+        out.write(f"0\nPOLYLINE\n8\n{layer}\n66\n1\n70\n1\n10\n0.0\n20\n0.0\n30\n0.0\n")
+        mm = np.column_stack([pts[:, 0], height - pts[:, 1]]) / px_per_mm
+        out.write("".join(f"0\nVERTEX\n8\n{layer}\n10\n{x:.4f}\n20\n{y:.4f}\n30\n0.0\n" for x, y in mm.tolist()))
+        out.write(f"0\nSEQEND\n8\n{layer}\n")
+    out.write("0\nENDSEC\n0\nEOF\n")
+
+
+class PdfWriter:
+    # PDF のオブジェクトを順に書き出し、最後に相互参照表を付ける（バイナリストリーム out に書き込む）
+    def __init__(self, out):
+        self.out = out
+        self.pos = 0
+        self.offsets = {}
+        self.count = 0
+        self._write(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data):
+        self.out.write(data)
+        self.pos += len(data)
+
+    def reserve(self):
+        # 書き出す前に参照するオブジェクトの番号を取る
+        self.count += 1
+        return self.count
+
+    def obj(self, num, body):
+        self.offsets[num] = self.pos
+        self._write(f"{num} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def stream(self, num, entries, chunks):
+        # chunks（bytes の反復）を Flate 圧縮しながら書き出す。長さは後から別のオブジェクトに書く
+        length = self.reserve()
+        self.offsets[num] = self.pos
+        self._write(f"{num} 0 obj\n<< {entries} /Filter /FlateDecode /Length {length} 0 R >>\nstream\n"
+                    .encode("latin-1"))
+        start = self.pos
+        z = zlib.compressobj(6)
+        for chunk in chunks:
+            self._write(z.compress(chunk))
+        self._write(z.flush())
+        size = self.pos - start
+        self._write(b"\nendstream\nendobj\n")
+        self.obj(length, str(size))
+
+    def close(self, root):
+        xref = self.pos
+        self._write(f"xref\n0 {self.count + 1}\n0000000000 65535 f \n".encode("latin-1"))
+        self._write("".join(f"{self.offsets[n]:010d} 00000 n \n" for n in range(1, self.count + 1)).encode("latin-1"))
+        self._write(f"trailer\n<< /Size {self.count + 1} /Root {root} 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+                    .encode("latin-1"))
+
+
+def _image_bands(image, channels, rows=PDF_BAND_ROWS):
+    # RGBA の PIL 画像を上から rows 行ずつ、channels の成分だけのバイト列にする
+    w, h = image.size
+    for y in range(0, h, rows):
+        band = np.asarray(image.crop((0, y, w, min(h, y + rows))))
+        yield np.ascontiguousarray(band[:, :, channels]).tobytes()
+
+
+def _num(v):
+    return f"{v:.2f}".rstrip("0").rstrip(".")
+
+
+def _pdf_path(start, segments):
+    # fit_segments() の形の閉じた曲線をPDFのパス演算子にする
+    ops = [f"{_num(start[0])} {_num(start[1])} m"]
+    for seg in segments:
+        coords = " ".join(f"{_num(x)} {_num(y)}" for x, y in seg.tolist())
+        ops.append(f"{coords} {'l' if len(seg) == 1 else 'c'}")
+    ops.append("h S")
+    return "\n".join(ops)
+
+
+def write_pdf(out, size, paths, image=None, box=None, px_per_mm=PX_PER_MM[0]):
+    # 1ページのベクターPDFをバイナリストリーム out に書き込む
+    # size: キャンバスの (幅, 高さ) [px]。ページは mm 換算した大きさにする
+    # paths: カット線 [(始点, [区間])]（geometry.fit_segments() の形、px）。直線・3次ベジェのまま書く
+    # image / box: 印刷レイヤーの RGBA 画像とキャンバス上の範囲 (x, y, w, h)。None ならカットレイヤーだけ
+    pdf = PdfWriter(out)
+    catalog, pages, page, content = (pdf.reserve() for _ in range(4))
+    scale = 72 / 25.4 / px_per_mm  # px → pt
+    width, height = size
+
+    layers = {}
+    if image is not None:
+        layers[PDF_PRINT_LAYER] = pdf.reserve()
+    layers[PDF_CUT_LAYER] = pdf.reserve()
+    for name, num in layers.items():
+        pdf.obj(num, f"<< /Type /OCG /Name ({name}) >>")
+    refs = " ".join(f"{num} 0 R" for num in layers.values())
+    pdf.obj(catalog, f"<< /Type /Catalog /Pages {pages} 0 R "
+                     f"/OCProperties << /OCGs [{refs}] /D << /Order [{refs}] /ON [{refs}] >> >> >>")
+    pdf.obj(pages, f"<< /Type /Pages /Kids [{page} 0 R] /Count 1 >>")
+
+    # 座標は px のまま書き、ページ全体を mm 換算して上下を反転する
+    ops = [f"q {scale:.6f} 0 0 {-scale:.6f} 0 {height * scale:.4f} cm"]
+    xobjects = ""
+    if image is not None:
+        bx, by, bw, bh = box
+        picture, alpha = pdf.reserve(), pdf.reserve()
+        entries = f"/Type /XObject /Subtype /Image /Width {bw} /Height {bh} /BitsPerComponent 8"
+        pdf.stream(alpha, f"{entries} /ColorSpace /DeviceGray", _image_bands(image, [3]))
+        pdf.stream(picture, f"{entries} /ColorSpace /DeviceRGB /SMask {alpha} 0 R", _image_bands(image, [0, 1, 2]))
+        xobjects = f"/XObject << /Im1 {picture} 0 R >> "
+        ops.append(f"/OC /L{layers[PDF_PRINT_LAYER]} BDC q {bw} 0 0 {-bh} {bx} {by + bh} cm /Im1 Do Q EMC")
+    ops.append(f"/OC /L{layers[PDF_CUT_LAYER]} BDC /CS0 CS 1 SCN {PDF_CUT_WIDTH} w 1 j 1 J")
+    ops.extend(_pdf_path(start, segments) for start, segments in paths)
+    ops.append("EMC Q")
+    pdf.stream(content, "", [("\n".join(ops) + "\n").encode("latin-1")])
+
+    # カット線の特色（代替色はマゼンタ）
+    spot = (f"[/Separation /{PDF_CUT_SPOT} /DeviceCMYK "
+            f"<< /FunctionType 2 /Domain [0 1] /C0 [0 0 0 0] /C1 [0 1 0 0] /N 1 >>]")
+    properties = " ".join(f"/L{num} {num} 0 R" for num in layers.values())
+    pdf.obj(page, f"<< /Type /Page /Parent {pages} 0 R /MediaBox [0 0 {width * scale:.4f} {height * scale:.4f}] "
+                  f"/Resources << {xobjects}/ColorSpace << /CS0 {spot} >> /Properties << {properties} >> >> "
+                  f"/Contents {content} 0 R >>")
+    pdf.close(catalog)